@@ -5,35 +5,64 @@ import config
 from utils import setup_logger
 import loggers as lg
 
+def stateKey(state):
+    '''Return (key, perm), the key of state in the tree and the evaluation cache.
+
+    With config.CANONICAL_KEYS, states exposing canonical() share a key with
+    their symmetric images, perm is then the one of utils.Symmetries.canonical.
+    Otherwise perm is None.
+    '''
+    if config.CANONICAL_KEYS and hasattr(state, 'canonical'):
+        return state.canonical()
+    return state.id, None
+
 class Node():
+    '''A node of the search tree.
+
+    Once expanded a node owns contiguous arrays with one slot per allowed
+    action: `actions`, the edge statistics `N`, `W`, `Q`, `P` and the child
+    nodes in `children`. Statistics are read and written in place.
+    A node may hold a symmetric image of the state that reached it, the
+    descent simply goes on in the frame of the node's own state.
+    Children start as None and are built by MCTS.addChild the first time
+    selection walks their edge, which also records the value `R` and the
+    done flag `D` returned by takeAction so descents never rebuild states.
+    `adjP` holds the priors used by selection, it is `P` itself except at
+    the root where the exploration noise is mixed in.
+    '''
+    __slots__ = ('state', 'playerTurn', 'id', 'actions', 'children', 'N', 'W', 'Q', 'P', 'adjP', 'R', 'D')
 
     def __init__(self, state):
         self.state = state
         self.playerTurn = state.playerTurn
-        self.id = state.id
-        self.edges = []
+        self.id = stateKey(state)[0]
+        self.actions = None
+        self.children = None
+        self.N = None
+        self.W = None
+        self.Q = None
+        self.P = None
+        self.adjP = None
+        self.R = None
+        self.D = None
 
     def isLeaf(self):
-        if len(self.edges) > 0:
+        if self.actions is not None and len(self.actions) > 0:
             return False
         else:
             return True
 
-class Edge():
-
-    def __init__(self, inNode, outNode, prior, action):
-        self.id = inNode.state.id + '|' + outNode.state.id
-        self.inNode = inNode
-        self.outNode = outNode
-        self.playerTurn = inNode.state.playerTurn
-        self.action = action
-
-        self.stats =  {
-                    'N': 0,
-                    'W': 0,
-                    'Q': 0,
-                    'P': prior,
-                }
+    def expand(self, actions, priors, children):
+        n = len(actions)
+        self.actions = np.array(actions, dtype=np.int32)
+        self.P = np.array(priors, dtype=np.float64)
+        self.N = np.zeros(n, dtype=np.int32)
+        self.W = np.zeros(n, dtype=np.float64)
+        self.Q = np.zeros(n, dtype=np.float64)
+        self.adjP = self.P
+        self.R = np.zeros(n, dtype=np.float64)
+        self.D = np.zeros(n, dtype=np.int8)
+        self.children = children
 
 
 class MCTS():
@@ -42,6 +71,8 @@ class MCTS():
         self.root = root
         self.tree = {}
         self.cpuct = cpuct
+        self.vectorized = config.MCTS_VECTORIZED
+        self.maxNodes = config.MCTS_MAX_NODES
         self.addNode(root)
 
     def __len__(self):
@@ -56,50 +87,29 @@ class MCTS():
 
         done = 0
         value = 0
-        lastAction = -1
 
         while not currentNode.isLeaf():
 
             lg.logger_mcts.info('PLAYER TURN...%d', currentNode.state.playerTurn)
 
-            maxQU = -99999
-
-            if currentNode == self.root:
-                epsilon = config.EPSILON
-                nu = np.random.dirichlet([config.ALPHA] * len(currentNode.edges))
-            else:
-                epsilon = 0
-                nu = [0] * len(currentNode.edges)
-
-            Nb = 0
-            for action, edge in currentNode.edges:
-                Nb = Nb + edge.stats['N']
-
-            for idx, (action, edge) in enumerate(currentNode.edges):
+            simulationIdx = self.selectChild(currentNode)
 
-                U = self.cpuct * \
-                    ((1-epsilon) * edge.stats['P'] + epsilon * nu[idx] )  * \
-                    np.sqrt(Nb) / (1 + edge.stats['N'])
+            simulationAction = currentNode.actions[simulationIdx]
 
-                Q = edge.stats['Q']
-
-                lg.logger_mcts.info('action: %d... N = %d, P = %f, nu = %f, adjP = %f, W = %f, Q = %f, U = %f, Q+U = %f'
-                    , action, edge.stats['N'], np.round(edge.stats['P'],6), np.round(nu[idx],6), ((1-epsilon) * edge.stats['P'] + epsilon * nu[idx] )
-                    , np.round(edge.stats['W'],6), np.round(Q,6), np.round(U,6), np.round(Q+U,6))
+            lg.logger_mcts.info('action with highest Q + U...%d', simulationAction)
 
-                if Q + U > maxQU:
-                    maxQU = Q + U
-                    simulationAction = action
-                    simulationEdge = edge
+            if currentNode.children[simulationIdx] is None:
+                self.addChild(currentNode, simulationIdx)
 
-            lg.logger_mcts.info('action with highest Q + U...%d', simulationAction)
+            #the value of the newState from the POV of the new playerTurn, recorded when the child was built
+            value = currentNode.R[simulationIdx]
+            done = currentNode.D[simulationIdx]
+            breadcrumbs.append((currentNode, simulationIdx))
+            currentNode = currentNode.children[simulationIdx]
 
-            newState, value, done = currentNode.state.takeAction(simulationAction) #the value of the newState from the POV of the new playerTurn
-            currentNode = simulationEdge.outNode
-            breadcrumbs.append(simulationEdge)
-            if simulationAction == lastAction:
-                import pdb; pdb.set_trace()
-            lastAction = simulationAction
+            if done:
+                # splendor hands back the expanded parent state on a deadlock
+                break
 
         lg.logger_mcts.info('DONE...%d', done)
 
@@ -107,32 +117,177 @@ class MCTS():
 
 
 
+    def selectChild(self, node):
+        if self.vectorized:
+            return self._selectChildVectorized(node)
+        else:
+            return self._selectChildLoop(node)
+
+    def _selectChildVectorized(self, node):
+        N, Q = node.N, node.Q
+
+        U = self.cpuct * node.adjP * np.sqrt(np.sum(N)) / (1 + N)
+        QU = Q + U
+
+        if lg.logger_mcts.isEnabledFor(logging.INFO):
+            for idx, action in enumerate(node.actions):
+                lg.logger_mcts.info('action: %d... N = %d, P = %f, adjP = %f, W = %f, Q = %f, U = %f, Q+U = %f'
+                    , action, N[idx], np.round(node.P[idx],6), np.round(node.adjP[idx],6)
+                    , np.round(node.W[idx],6), np.round(Q[idx],6), np.round(U[idx],6), np.round(QU[idx],6))
+
+        # argmax keeps the first maximum, like the strict comparison of the loop
+        return int(np.argmax(QU))
+
+    def _selectChildLoop(self, node):
+        maxQU = -99999
+
+        N, W, Q, P, adjP = node.N, node.W, node.Q, node.P, node.adjP
+        Nb = np.sum(N)
+
+        for idx, action in enumerate(node.actions):
+
+            U = self.cpuct * adjP[idx] * np.sqrt(Nb) / (1 + N[idx])
+
+            lg.logger_mcts.info('action: %d... N = %d, P = %f, adjP = %f, W = %f, Q = %f, U = %f, Q+U = %f'
+                , action, N[idx], np.round(P[idx],6), np.round(adjP[idx],6)
+                , np.round(W[idx],6), np.round(Q[idx],6), np.round(U,6), np.round(Q[idx]+U,6))
+
+            if Q[idx] + U > maxQU:
+                maxQU = Q[idx] + U
+                simulationIdx = idx
+
+        return simulationIdx
+
+    def addRootNoise(self):
+        '''Mix fresh Dirichlet noise into the root priors, once per search'''
+        root = self.root
+        if root.isLeaf():
+            return
+        nu = np.random.dirichlet([config.ALPHA] * len(root.actions))
+        root.adjP = (1-config.EPSILON) * root.P + config.EPSILON * nu
+        lg.logger_mcts.info('ROOT NOISE...%s', nu)
+
+    def changeRoot(self, node):
+        # the old root is an ordinary node from now on
+        if not self.root.isLeaf():
+            self.root.adjP = self.root.P
+        self.root = node
+        self.prune()
+        self.evict()
+
+    def prune(self):
+        '''Keep only the nodes that can still be reached from the root'''
+        tree = {self.root.id: self.root}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.children is None:
+                continue
+            for child in node.children:
+                if child is not None and child.id not in tree:
+                    tree[child.id] = child
+                    stack.append(child)
+
+        lg.logger_mcts.info('PRUNED TREE FROM %d TO %d NODES', len(self.tree), len(tree))
+        self.tree = tree
+
+    def evict(self):
+        '''Detach the least visited subtrees until the tree fits in maxNodes.
+
+        The statistics of a detached edge stay in its parent, only the nodes
+        below it are dropped and get rebuilt if selection walks it again.
+        '''
+        while self.maxNodes is not None and len(self.tree) > self.maxNodes:
+            edges = []
+            for node in self.tree.values():
+                if node.children is None:
+                    continue
+                for idx, child in enumerate(node.children):
+                    if child is not None and child is not self.root:
+                        edges.append((node.N[idx], node, idx))
+            if len(edges) == 0:
+                break
+            edges.sort(key=lambda edge: edge[0])
+
+            # subtree sizes overcount shared transpositions, hence the outer loop
+            excess = len(self.tree) - self.maxNodes
+            for _, node, idx in edges:
+                if excess <= 0:
+                    break
+                child = node.children[idx]
+                if child is None:
+                    continue
+                excess -= self.subtreeSize(child)
+                node.children[idx] = None
+
+            self.prune()
+
+    def subtreeSize(self, node):
+        seen = set([node.id])
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.children is None:
+                continue
+            for child in node.children:
+                if child is not None and child.id not in seen:
+                    seen.add(child.id)
+                    stack.append(child)
+        return len(seen)
+
     def backFill(self, leaf, value, breadcrumbs):
         lg.logger_mcts.info('------DOING BACKFILL------')
 
         currentPlayer = leaf.state.playerTurn
 
-        for edge in breadcrumbs:
-            playerTurn = edge.playerTurn
+        for node, idx in breadcrumbs:
+            playerTurn = node.playerTurn
             if playerTurn == currentPlayer:
                 direction = 1
             else:
                 direction = -1
 
-            edge.stats['N'] = edge.stats['N'] + 1
-            edge.stats['W'] = edge.stats['W'] + value * direction
-            edge.stats['Q'] = edge.stats['W'] / edge.stats['N']
+            node.N[idx] = node.N[idx] + 1
+            node.W[idx] = node.W[idx] + value * direction
+            node.Q[idx] = node.W[idx] / node.N[idx]
 
             lg.logger_mcts.info('updating edge with value %f for player %d... N = %d, W = %f, Q = %f'
                 , value * direction
                 , playerTurn
-                , edge.stats['N']
-                , edge.stats['W']
-                , edge.stats['Q']
+                , node.N[idx]
+                , node.W[idx]
+                , node.Q[idx]
                 )
 
-            edge.outNode.state.render(lg.logger_mcts)
+            node.children[idx].state.render(lg.logger_mcts)
+
+    def addChild(self, node, idx):
+        '''Build the child behind an edge the first time selection walks it'''
+        newState, value, done = node.state.takeAction(node.actions[idx]) #the value of the newState from the POV of the new playerTurn
+        key = stateKey(newState)[0]
+        if key not in self.tree:
+            child = Node(newState)
+            self.addNode(child)
+            lg.logger_mcts.info('added node...%s...p = %f', child.id, node.P[idx])
+        else:
+            child = self.tree[key]
+            lg.logger_mcts.info('existing node...%s...', child.id)
+        node.children[idx] = child
+        node.R[idx] = value
+        node.D[idx] = done
+
+    def addVirtualLoss(self, breadcrumbs):
+        # count a pending visit as a loss for the player choosing the edge
+        for node, idx in breadcrumbs:
+            node.N[idx] = node.N[idx] + config.VIRTUAL_LOSS
+            node.W[idx] = node.W[idx] - config.VIRTUAL_LOSS
+            node.Q[idx] = node.W[idx] / node.N[idx]
+
+    def revertVirtualLoss(self, breadcrumbs):
+        for node, idx in breadcrumbs:
+            node.N[idx] = node.N[idx] - config.VIRTUAL_LOSS
+            node.W[idx] = node.W[idx] + config.VIRTUAL_LOSS
+            node.Q[idx] = node.W[idx] / node.N[idx] if node.N[idx] > 0 else 0
 
     def addNode(self, node):
         self.tree[node.id] = node
-
@@ -4,8 +4,8 @@ import numpy as np
 import random
 
 import MCTS as mc
+from cache import EvalCache
 from game import GameState
-from loss import softmax_cross_entropy_with_logits
 
 import config
 import loggers as lg
@@ -44,7 +44,10 @@ class Agent():
         self.cpuct = cpuct
 
         self.MCTSsimulations = mcts_simulations
+        self.MCTSbatchSize = config.MCTS_BATCH_SIZE
         self.model = model
+        self.cache = EvalCache(config.EVAL_CACHE_SIZE)
+        self.batchSizes = []
 
         self.mcts = None
 
@@ -73,22 +76,74 @@ class Agent():
         self.mcts.backFill(leaf, value, breadcrumbs)
 
 
+    def simulateBatch(self, batchSize):
+
+        lg.logger_mcts.info('ROOT NODE...%s', self.mcts.root.state.id)
+        lg.logger_mcts.info('CURRENT PLAYER...%d', self.mcts.root.state.playerTurn)
+
+        ##### MOVE TO batchSize LEAF NODES, VIRTUAL LOSS STEERS EACH PATH AWAY FROM THE PREVIOUS ONES
+        paths = []
+        for _ in range(batchSize):
+            leaf, value, done, breadcrumbs = self.mcts.moveToLeaf()
+            self.mcts.addVirtualLoss(breadcrumbs)
+            paths.append((leaf, value, done, breadcrumbs))
+
+        ##### EVALUATE THE DISTINCT LEAF NODES IN A SINGLE PREDICT
+        leaves = {}
+        for leaf, value, done, breadcrumbs in paths:
+            if done == 0 and leaf.id not in leaves:
+                leaves[leaf.id] = leaf
+        values = self.evaluateLeaves(list(leaves.values()))
+
+        ##### BACKFILL EVERY PATH
+        for leaf, value, done, breadcrumbs in paths:
+            self.mcts.revertVirtualLoss(breadcrumbs)
+            if done == 0:
+                value = values[leaf.id]
+            self.mcts.backFill(leaf, value, breadcrumbs)
+
+        lg.logger_mcts.info('BATCH OF %d PATHS REACHED %d LEAVES', batchSize, len(leaves))
+
+
     def act(self, state, tau):
 
-        if self.mcts == None or state.id not in self.mcts.tree:
+        if self.mcts == None or mc.stateKey(state)[0] not in self.mcts.tree:
             self.buildMCTS(state)
         else:
             self.changeRootMCTS(state)
 
-        #### run the simulation
-        for sim in range(self.MCTSsimulations):
-            lg.logger_mcts.info('***************************')
-            lg.logger_mcts.info('****** SIMULATION %d ******', sim + 1)
-            lg.logger_mcts.info('***************************')
+        #### expand the root first, the exploration noise is drawn once over its edges
+        sim = 0
+        if self.mcts.root.isLeaf():
             self.simulate()
+            sim = 1
+        self.mcts.addRootNoise()
+
+        #### run the simulation
+        if self.MCTSbatchSize > 1:
+            self.batchSizes = []
+            while sim < self.MCTSsimulations:
+                batchSize = min(self.MCTSbatchSize, self.MCTSsimulations - sim)
+                lg.logger_mcts.info('***************************')
+                lg.logger_mcts.info('**** SIMULATIONS %d-%d ****', sim + 1, sim + batchSize)
+                lg.logger_mcts.info('***************************')
+                self.simulateBatch(batchSize)
+                sim += batchSize
+            lg.logger_mcts.info('EFFECTIVE BATCH SIZE...%f', self.effectiveBatchSize)
+        else:
+            while sim < self.MCTSsimulations:
+                lg.logger_mcts.info('***************************')
+                lg.logger_mcts.info('****** SIMULATION %d ******', sim + 1)
+                lg.logger_mcts.info('***************************')
+                self.simulate()
+                sim += 1
+
+        #### keep the tree inside its node budget
+        self.mcts.evict()
 
         #### get action values
         pi, values = self.getAV(1)
+        pi, values = self.toStateFrame(state, pi, values)
 
         ####pick the action
         action, value = self.chooseAction(pi, values, tau)
@@ -101,32 +156,69 @@ class Agent():
         lg.logger_mcts.info('CHOSEN ACTION...%d', action)
         lg.logger_mcts.info('MCTS PERCEIVED VALUE...%f', value)
         lg.logger_mcts.info('NN PERCEIVED VALUE...%f', NN_value)
+        lg.logger_mcts.info('EVAL CACHE...%s', self.cache.stats())
 
         return (action, pi, value, NN_value)
 
 
-    def get_preds(self, state):
-        #predict the leaf
-        inputToModel = np.array([self.model.convertToModelInput(state)])
-
-        preds = self.model.predict(inputToModel)
-        value_array = preds[0]
-        logits_array = preds[1]
-        value = value_array[0]
-
-        logits = logits_array[0]
-
-        allowedActions = state.allowedActions
-
-        mask = np.ones(logits.shape,dtype=bool)
-        mask[allowedActions] = False
-        logits[mask] = -100
+    @property
+    def effectiveBatchSize(self):
+        '''Mean number of leaves evaluated per predict call during the last batched search'''
+        if len(self.batchSizes) == 0:
+            return 0
+        return np.mean(self.batchSizes)
 
-        #SOFTMAX
-        odds = np.exp(logits)
-        probs = odds / np.sum(odds) ###put this just before the for?
+    def get_preds(self, state):
+        return self.get_preds_batch([state])[0]
+
+    def get_preds_batch(self, states):
+        '''get_preds for many states with one predict call, returns a (value, probs, allowedActions) per state'''
+        preds = [self._cacheGet(state) for state in states]
+        misses = [i for i, cached in enumerate(preds) if cached is None]
+        if len(misses) == 0:
+            return preds
+
+        #predict the leaves
+        inputToModel = np.array([self.model.convertToModelInput(states[i]) for i in misses])
+        value_array, logits_array = self.model.predict(inputToModel)
+        probs_array = self._maskedSoftmax([states[i] for i in misses], logits_array)
+
+        for i, value, probs in zip(misses, value_array, probs_array):
+            self._cachePut(states[i], value, probs)
+            preds[i] = ((value, probs, states[i].allowedActions))
+        return preds
 
-        return ((value, probs, allowedActions))
+    def _cacheGet(self, state):
+        key, perm = mc.stateKey(state)
+        cached = self.cache.get(key, self.model.version)
+        if cached is None:
+            return None
+        value, probs = cached
+        if perm is not None:
+            probs = probs[perm]
+            probs.flags.writeable = False
+        return ((value, probs, state.allowedActions))
+
+    def _cachePut(self, state, value, probs):
+        # entries are stored in the frame of the canonical state
+        key, perm = mc.stateKey(state)
+        if perm is not None:
+            probs = probs[np.argsort(perm)]
+            probs.flags.writeable = False
+        self.cache.put(key, self.model.version, (value, probs))
+
+    def _maskedSoftmax(self, states, logits):
+        '''Softmax of each row of logits over the allowed actions of its state'''
+        allowed = [state.allowedActions for state in states]
+        rows = np.repeat(np.arange(len(states)), [len(actions) for actions in allowed])
+        legal = np.zeros(logits.shape, dtype=bool)
+        legal[rows, np.concatenate(allowed).astype(np.intp)] = True
+        logits = np.where(legal, logits, -100)
+
+        odds = np.exp(logits - np.max(logits, axis=1, keepdims=True))
+        probs = odds / np.sum(odds, axis=1, keepdims=True)
+        probs.flags.writeable = False # shared through the evaluation cache
+        return probs
 
 
     def evaluateLeaf(self, leaf, value, done, breadcrumbs):
@@ -138,20 +230,7 @@ class Agent():
             value, probs, allowedActions = self.get_preds(leaf.state)
             lg.logger_mcts.info('PREDICTED VALUE FOR %d: %f', leaf.state.playerTurn, value)
 
-            probs = probs[allowedActions]
-
-            for idx, action in enumerate(allowedActions):
-                newState, _, _ = leaf.state.takeAction(action)
-                if newState.id not in self.mcts.tree:
-                    node = mc.Node(newState)
-                    self.mcts.addNode(node)
-                    lg.logger_mcts.info('added node...%s...p = %f', node.id, probs[idx])
-                else:
-                    node = self.mcts.tree[newState.id]
-                    lg.logger_mcts.info('existing node...%s...', node.id)
-
-                newEdge = mc.Edge(leaf, node, probs[idx], action)
-                leaf.edges.append((action, newEdge))
+            self.expandLeaf(leaf, probs, allowedActions)
 
         else:
             lg.logger_mcts.info('GAME VALUE FOR %d: %f', leaf.playerTurn, value)
@@ -159,19 +238,59 @@ class Agent():
         return ((value, breadcrumbs))
 
 
+    def evaluateLeaves(self, leaves):
+        '''Evaluate and expand several non-terminal leaves with one predict call, returns {leaf.id: value}'''
+        values = {}
+        if len(leaves) == 0:
+            return values
+
+        lg.logger_mcts.info('------EVALUATING %d LEAVES------', len(leaves))
+
+        # every cache miss is evaluated by the single predict call
+        misses = self.cache.misses
+        preds = self.get_preds_batch([leaf.state for leaf in leaves])
+        misses = self.cache.misses - misses
+
+        for leaf, (value, probs, allowedActions) in zip(leaves, preds):
+            lg.logger_mcts.info('PREDICTED VALUE FOR %d: %f', leaf.state.playerTurn, value)
+            self.expandLeaf(leaf, probs, allowedActions)
+            values[leaf.id] = value
+
+        if misses > 0:
+            self.batchSizes.append(misses)
+
+        return values
+
+
+    def expandLeaf(self, leaf, probs, allowedActions):
+        # edges are created from the priors only, MCTS.addChild builds a child once it is visited
+        leaf.expand(allowedActions, probs[allowedActions], [None] * len(allowedActions))
+
+
 
     def getAV(self, tau):
-        edges = self.mcts.root.edges
+        root = self.mcts.root
         pi = np.zeros(self.action_size, dtype=np.integer)
         values = np.zeros(self.action_size, dtype=np.float32)
 
-        for action, edge in edges:
-            pi[action] = pow(edge.stats['N'], 1/tau)
-            values[action] = edge.stats['Q']
+        pi[root.actions] = np.power(root.N, 1/tau)
+        values[root.actions] = root.Q
 
         pi = pi / (np.sum(pi) * 1.0)
         return pi, values
 
+    def toStateFrame(self, state, pi, values):
+        '''Map root action values onto state when the root node holds a symmetric image of it'''
+        root = self.mcts.root.state
+        if root.id == state.id:
+            return pi, values
+
+        _, rootPerm = mc.stateKey(root)
+        _, statePerm = mc.stateKey(state)
+        toCanonical = np.arange(len(pi)) if rootPerm is None else np.argsort(rootPerm)
+        m = toCanonical if statePerm is None else toCanonical[statePerm]
+        return pi[m], values[m]
+
     def chooseAction(self, pi, values, tau):
         if tau == 0:
             actions = np.argwhere(pi == max(pi))
@@ -227,4 +346,5 @@ class Agent():
 
     def changeRootMCTS(self, state):
         lg.logger_mcts.info('****** CHANGING ROOT OF MCTS TREE TO %s FOR AGENT %s ******', state.id, self.name)
-        self.mcts.root = self.mcts.tree[state.id]
+        self.mcts.changeRoot(self.mcts.tree[mc.stateKey(state)[0]])
+        self.root = self.mcts.root
@@ -0,0 +1,31 @@
+'''Throughput benchmarks for the game state implementations
+
+    python bench_games.py
+'''
+import random
+import time
+
+from bench_mcts import load_game
+
+def random_playouts(game, playouts=200, seed=0):
+    '''Play random games to the end, return (states per second, states)'''
+    random.seed(seed)
+    states = 0
+    start = time.time()
+    for _ in range(playouts):
+        state = game.reset()
+        done = 0
+        while done == 0:
+            state, _, done = state.takeAction(random.choice(state.allowedActions))
+            states += 1
+    return states / (time.time() - start), states
+
+def bench_connect4():
+    connect4 = load_game('connect4')
+    print('CONNECT4 RANDOM PLAYOUTS')
+    for name, bitboard in [('GameState', False), ('BitboardGameState', True)]:
+        rate, states = random_playouts(connect4.Game(bitboard=bitboard))
+        print('%-18s %8.0f states/s (%d states)' % (name, rate, states))
+
+if __name__ == '__main__':
+    bench_connect4()
@@ -0,0 +1,76 @@
+'''Micro benchmarks for the MCTS search
+
+    python bench_mcts.py
+
+The searches run against UniformModel, which returns a zero value and flat
+priors, so the timings only cover the tree and game operations.
+'''
+import importlib.util
+import timeit
+
+import numpy as np
+
+import config
+import loggers as lg
+from agent import Agent
+
+GAMES = ['connect4', 'splendor']
+
+def load_game(name):
+    spec = importlib.util.spec_from_file_location(name + '_game', 'games/' + name + '/game.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class UniformModel():
+
+    def __init__(self, output_dim):
+        self.output_dim = output_dim
+        self.version = 0
+
+    def convertToModelInput(self, state):
+        return state.binary
+
+    def predict(self, x):
+        return [np.zeros((len(x), 1)), np.zeros((len(x), self.output_dim))]
+
+def build_agent(game, sims):
+    env = game.Game()
+    agent = Agent('bench', env.state_size, env.action_size, sims, config.CPUCT, UniformModel(env.action_size))
+    agent.buildMCTS(env.gameState)
+    for _ in range(sims):
+        agent.simulate()
+    return agent
+
+def bench_root_noise(game, sims=config.MCTS_SIMS, number=200, repeat=5):
+    '''Time the root selection step and a full descent with the root noise
+    drawn every simulation (the old behaviour) against the noise drawn once
+    per move'''
+    mcts = build_agent(game, sims).mcts
+
+    def timed(f):
+        return min(timeit.repeat(f, number=number, repeat=repeat)) / number
+
+    def select_noise_per_sim():
+        mcts.addRootNoise()
+        mcts.selectChild(mcts.root)
+
+    def descend_noise_per_sim():
+        mcts.addRootNoise()
+        mcts.moveToLeaf()
+
+    results = {'select': [timed(select_noise_per_sim)], 'descend': [timed(descend_noise_per_sim)]}
+    mcts.addRootNoise()
+    results['select'].append(timed(lambda: mcts.selectChild(mcts.root)))
+    results['descend'].append(timed(mcts.moveToLeaf))
+    return results
+
+if __name__ == '__main__':
+    lg.logger_mcts.disabled = True
+
+    print('ROOT NOISE, TIME PER SIMULATION')
+    for name in GAMES:
+        results = bench_root_noise(load_game(name))
+        for step, (per_sim, per_move) in results.items():
+            print('%-10s %-8s noise per sim %8.1f us   noise per move %8.1f us   saved %6.1f us'
+                % (name, step, per_sim * 1e6, per_move * 1e6, (per_sim - per_move) * 1e6))
@@ -0,0 +1,58 @@
+'''Memory footprint of game states and search tree nodes
+
+    python bench_memory.py
+
+Sizes are measured with tracemalloc as the memory still allocated after
+building the objects, so arrays, ids and cached tables owned by a single
+object are included and anything shared between objects is not.
+'''
+import random
+import tracemalloc
+
+import loggers as lg
+from bench_mcts import GAMES, load_game, build_agent
+
+GAMES = GAMES + ['metasquares']
+
+def traced(build):
+    '''Return (objects built, bytes still allocated by them)'''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return objects, size
+
+def collect_states(game, count=2000, moves=30, seed=0):
+    '''Random states from playouts of at most `moves` moves'''
+    random.seed(seed)
+    states = []
+    while len(states) < count:
+        state = game.Game().reset()
+        done = 0
+        for _ in range(moves):
+            if done or len(states) == count:
+                break
+            state, _, done = state.takeAction(random.choice(state.allowedActions))
+            states.append(state)
+    return states
+
+def bench_state(game):
+    states, size = traced(lambda: collect_states(game))
+    return size / len(states)
+
+def bench_node(game, sims=200):
+    '''Bytes per tree node, including the state it holds and its edge arrays'''
+    agent, size = traced(lambda: build_agent(game, sims))
+    return size / len(agent.mcts.tree), len(agent.mcts.tree)
+
+if __name__ == '__main__':
+    lg.logger_mcts.disabled = True
+
+    print('BYTES PER OBJECT')
+    for name in GAMES:
+        game = load_game(name)
+        perState = bench_state(game)
+        perNode, nodes = bench_node(game)
+        print('%-12s state %8.0f   node %8.0f   node without state %8.0f   (%d nodes)'
+            % (name, perState, perNode, perNode - perState, nodes))
@@ -0,0 +1,33 @@
+'''Per call latency of keras predict against Gen_Model.predict_fast
+
+    python bench_model.py
+'''
+import timeit
+
+import numpy as np
+
+import config
+from game import Game
+from model import Residual_CNN
+
+BATCH_SIZES = [1, 8, 32, 128]
+
+def bench_predict(nn, number=5, repeat=3):
+    '''Return {batch size: (keras predict seconds, predict_fast seconds)} per call'''
+    x = np.random.rand(max(BATCH_SIZES), *nn.input_dim).astype(np.float32)
+    results = {}
+    for size in BATCH_SIZES:
+        batch = x[:size]
+        nn.predict_fast(batch) # build the function outside the timing
+        results[size] = tuple(min(timeit.repeat(lambda: predict(batch), number=number, repeat=repeat)) / number
+            for predict in (lambda b: nn.model.predict(b, verbose=0), nn.predict_fast))
+    return results
+
+if __name__ == '__main__':
+    env = Game()
+    nn = Residual_CNN(config.REG_CONST, config.LEARNING_RATE, env.input_shape, env.action_size, config.HIDDEN_CNN_LAYERS)
+
+    print('PREDICT LATENCY PER CALL')
+    for size, (slow, fast) in bench_predict(nn).items():
+        print('batch %4d   predict %8.2f ms   predict_fast %8.2f ms   speedup %5.1fx'
+            % (size, slow * 1e3, fast * 1e3, slow / fast))
@@ -0,0 +1,75 @@
+'''Speed and divergence of the reduced precision NumPy models
+
+    python bench_quantize.py run/memory/memory0003.p [run/models/version0003.h5]
+
+Every precision of numpy_model is compared with the float32 Keras model on
+the positions of a pickled Memory, like the ones main.py saves. Without a
+model file the network keeps its random initial weights. The policies are
+compared over the legal actions only, as Agent.get_preds sees them.
+
+The times are for 1 and 32 states, the speedups against the float32 NumPy
+model. NumpyModel computes every precision in float32, so only the file
+sizes and the errors should differ between them.
+'''
+import os
+import pickle
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+import config
+from game import Game
+from model import Residual_CNN
+from numpy_model import PRECISIONS, NumpyModel, export
+
+def legal_probs(logits, states):
+    probs = np.zeros_like(logits)
+    for i, state in enumerate(states):
+        allowed = state.allowedActions
+        odds = np.exp(logits[i, allowed] - np.max(logits[i, allowed]))
+        probs[i, allowed] = odds / np.sum(odds)
+    return probs
+
+def divergence(reference, preds, states):
+    '''Return (max value error, mean KL of the policies, share of identical best moves)'''
+    p = legal_probs(reference[1], states)
+    q = legal_probs(preds[1], states)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kl = np.sum(np.where(p > 0, p * np.log(p / q), 0), axis=1)
+    agree = np.mean(np.argmax(p, axis=1) == np.argmax(q, axis=1))
+    return np.max(np.abs(reference[0] - preds[0])), np.mean(kl), agree
+
+def timed(predict, x, number=10, repeat=3):
+    return min(timeit.repeat(lambda: predict(x), number=number, repeat=repeat)) / number
+
+if __name__ == '__main__':
+    memory = pickle.load(open(sys.argv[1], 'rb'))
+    states = [s['state'] for s in memory.ltmemory or memory.stmemory]
+
+    env = Game()
+    nn = Residual_CNN(config.REG_CONST, config.LEARNING_RATE, env.input_shape, env.action_size, config.HIDDEN_CNN_LAYERS)
+    if len(sys.argv) > 2:
+        nn.model.load_weights(sys.argv[2])
+
+    x = np.array([nn.convertToModelInput(state) for state in states], dtype=np.float32)
+    reference = nn.model.predict(x, verbose=0)
+    keras = {size: timed(lambda x: nn.model.predict(x, verbose=0), x[:size]) for size in (1, 32)}
+
+    print('%d POSITIONS, FLOAT32 KERAS %.2f ms (1 state) %.2f ms (32 states)'
+        % (len(states), keras[1] * 1e3, keras[32] * 1e3))
+    folder = tempfile.mkdtemp()
+    numpy32 = None
+    for precision in PRECISIONS:
+        path = os.path.join(folder, precision + '.npz')
+        export(nn, path, precision)
+        model = NumpyModel.load(path)
+        value, kl, agree = divergence(reference, model.predict(x), states)
+        times = [timed(model.predict, x[:size]) for size in (1, 32)]
+        numpy32 = numpy32 or times
+        print('%-8s %7.0f kB   value max err %.2e   policy KL %.2e   same best move %5.1f%%   %6.2f %6.2f ms   speedup %5.2fx %5.2fx'
+            % (precision, os.path.getsize(path) / 1e3, value, kl, agree * 100, times[0] * 1e3, times[1] * 1e3
+            , numpy32[0] / times[0], numpy32[1] / times[1]))
+        os.remove(path)
+    os.rmdir(folder)
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+
+
+class EvalCache():
+    '''LRU cache of network evaluations keyed by state id.
+
+    Entries are only valid for the model version they were computed with,
+    a lookup or insert with a different version empties the cache first.
+    A maxsize of 0 disables caching.
+    '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _checkVersion(self, version):
+        if version != self.version:
+            if len(self.entries) > 0:
+                self.invalidations += 1
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        self._checkVersion(version)
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, version, value):
+        if self.maxsize == 0:
+            return
+        self._checkVersion(version)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0
+        return self.hits / lookups
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hitRate,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
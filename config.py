@@ -6,6 +6,14 @@ TURNS_UNTIL_TAU0 = 10 # turn on which it starts playing deterministically
 CPUCT = 1
 EPSILON = 0.2
 ALPHA = 0.8
+MCTS_VECTORIZED = True # False falls back to the per-edge selection loop
+MCTS_BATCH_SIZE = 1 # leaves evaluated per predict call, 1 runs the simulations one by one
+VIRTUAL_LOSS = 1
+MCTS_MAX_NODES = None # node budget of each search tree, None for no limit
+EVAL_CACHE_SIZE = 20000 # network evaluations kept per agent, 0 disables the cache
+CANONICAL_KEYS = True # symmetric positions share tree nodes and cached evaluations
+INFERENCE_MAX_BATCH = 32 # states the inference server runs per predict call
+INFERENCE_MAX_WAIT = 0.005 # seconds the inference server waits for more requests before predicting
 
 
 #### RETRAINING
@@ -0,0 +1 @@
+# makes pytest put the repository root on sys.path, the games import utils from it
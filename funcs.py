@@ -18,7 +18,7 @@ def playMatchesBetweenVersions(env, run_version, player1version, player2version,
 
         if player1version > 0:
             player1_network = player1_NN.read(env.name, run_version, player1version)
-            player1_NN.model.set_weights(player1_network.get_weights())   
+            player1_NN.set_weights(player1_network.get_weights())   
         player1 = Agent('player1', env.state_size, env.action_size, config.MCTS_SIMS, config.CPUCT, player1_NN)
 
     if player2version == -1:
@@ -27,7 +27,7 @@ def playMatchesBetweenVersions(env, run_version, player1version, player2version,
         player2_NN = Residual_CNN(config.REG_CONST, config.LEARNING_RATE, env.input_shape,   env.action_size, config.HIDDEN_CNN_LAYERS)
         if player2version > 0:
             player2_network = player2_NN.read(env.name, run_version, player2version)
-            player2_NN.model.set_weights(player2_network.get_weights())
+            player2_NN.set_weights(player2_network.get_weights())
         player2 = Agent('player2', env.state_size, env.action_size, config.MCTS_SIMS, config.CPUCT, player2_NN)
 
     scores, memory, points, sp_scores = playMatches(player1, player2, EPISODES, logger, turns_until_tau0, None, goes_first)
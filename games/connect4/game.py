@@ -1,11 +1,101 @@
 import numpy as np
 import logging
 
+from utils import cachedProperty, Symmetries
+
+SYMMETRIES = Symmetries([
+	np.arange(42)
+	, np.arange(42).reshape(6, 7)[:, ::-1].flatten() # left-right mirror
+	])
+
+# bit of each board cell in a bitboard, every column takes 7 bits (6 rows from the bottom and an empty sentinel)
+CELL_BITS = np.array([7 * (i % 7) + 5 - i // 7 for i in range(42)], dtype=np.uint64)
+
+# bits of the id for every value of the 6 bits of a column, the id packs the board row by row from the top left
+COLUMN_IDS = [[sum(1 << (41 - 7 * (5 - h) - c) for h in range(6) if v >> h & 1) for v in range(64)] for c in range(7)]
+
+# cells of every line of four, shared by all states
+WINNERS = [
+	[0,1,2,3],
+	[1,2,3,4],
+	[2,3,4,5],
+	[3,4,5,6],
+	[7,8,9,10],
+	[8,9,10,11],
+	[9,10,11,12],
+	[10,11,12,13],
+	[14,15,16,17],
+	[15,16,17,18],
+	[16,17,18,19],
+	[17,18,19,20],
+	[21,22,23,24],
+	[22,23,24,25],
+	[23,24,25,26],
+	[24,25,26,27],
+	[28,29,30,31],
+	[29,30,31,32],
+	[30,31,32,33],
+	[31,32,33,34],
+	[35,36,37,38],
+	[36,37,38,39],
+	[37,38,39,40],
+	[38,39,40,41],
+
+	[0,7,14,21],
+	[7,14,21,28],
+	[14,21,28,35],
+	[1,8,15,22],
+	[8,15,22,29],
+	[15,22,29,36],
+	[2,9,16,23],
+	[9,16,23,30],
+	[16,23,30,37],
+	[3,10,17,24],
+	[10,17,24,31],
+	[17,24,31,38],
+	[4,11,18,25],
+	[11,18,25,32],
+	[18,25,32,39],
+	[5,12,19,26],
+	[12,19,26,33],
+	[19,26,33,40],
+	[6,13,20,27],
+	[13,20,27,34],
+	[20,27,34,41],
+
+	[3,9,15,21],
+	[4,10,16,22],
+	[10,16,22,28],
+	[5,11,17,23],
+	[11,17,23,29],
+	[17,23,29,35],
+	[6,12,18,24],
+	[12,18,24,30],
+	[18,24,30,36],
+	[13,19,25,31],
+	[19,25,31,37],
+	[20,26,32,38],
+
+	[3,11,19,27],
+	[2,10,18,26],
+	[10,18,26,34],
+	[1,9,17,25],
+	[9,17,25,33],
+	[17,25,33,41],
+	[0,8,16,24],
+	[8,16,24,32],
+	[16,24,32,40],
+	[7,15,23,31],
+	[15,23,31,39],
+	[14,22,30,38],
+	]
+
 class Game:
 
-	def __init__(self):		
+	def __init__(self, bitboard=True):		
+		self.stateClass = BitboardGameState if bitboard else GameState
 		self.currentPlayer = 1
-		self.gameState = GameState(np.array([0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0], dtype=np.int), 1)
+		self.gameState = self.stateClass(np.array([0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0], dtype=np.int), 1)
 		self.actionSpace = np.array([0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0], dtype=np.int)
 		self.pieces = {'1':'X', '0': '-', '-1':'O'}
 		self.grid_shape = (6,7)
@@ -15,7 +105,7 @@ class Game:
 		self.action_size = len(self.actionSpace)
 
 	def reset(self):
-		self.gameState = GameState(np.array([0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0], dtype=np.int), 1)
+		self.gameState = self.stateClass(np.array([0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0], dtype=np.int), 1)
 		self.currentPlayer = 1
 		return self.gameState
 
@@ -50,96 +140,54 @@ class Game:
 			, currentAV[41], currentAV[40],currentAV[39], currentAV[38], currentAV[37], currentAV[36], currentAV[35]
 					])
 
-		identities.append((GameState(currentBoard, state.playerTurn), currentAV))
+		identities.append((state.__class__(currentBoard, state.playerTurn), currentAV))
 
 		return identities
 
 
 class GameState():
+	__slots__ = ('board', 'playerTurn', '_canonical', '_cachedBinary', '_cachedId', '_cachedAllowedActions'
+		, '_cachedIsEndGame', '_cachedValue', '_cachedScore')
+
+	pieces = {'1':'X', '0': '-', '-1':'O'}
+	winners = WINNERS
+
 	def __init__(self, board, playerTurn):
 		self.board = board
-		self.pieces = {'1':'X', '0': '-', '-1':'O'}
-		self.winners = [
-			[0,1,2,3],
-			[1,2,3,4],
-			[2,3,4,5],
-			[3,4,5,6],
-			[7,8,9,10],
-			[8,9,10,11],
-			[9,10,11,12],
-			[10,11,12,13],
-			[14,15,16,17],
-			[15,16,17,18],
-			[16,17,18,19],
-			[17,18,19,20],
-			[21,22,23,24],
-			[22,23,24,25],
-			[23,24,25,26],
-			[24,25,26,27],
-			[28,29,30,31],
-			[29,30,31,32],
-			[30,31,32,33],
-			[31,32,33,34],
-			[35,36,37,38],
-			[36,37,38,39],
-			[37,38,39,40],
-			[38,39,40,41],
-
-			[0,7,14,21],
-			[7,14,21,28],
-			[14,21,28,35],
-			[1,8,15,22],
-			[8,15,22,29],
-			[15,22,29,36],
-			[2,9,16,23],
-			[9,16,23,30],
-			[16,23,30,37],
-			[3,10,17,24],
-			[10,17,24,31],
-			[17,24,31,38],
-			[4,11,18,25],
-			[11,18,25,32],
-			[18,25,32,39],
-			[5,12,19,26],
-			[12,19,26,33],
-			[19,26,33,40],
-			[6,13,20,27],
-			[13,20,27,34],
-			[20,27,34,41],
-
-			[3,9,15,21],
-			[4,10,16,22],
-			[10,16,22,28],
-			[5,11,17,23],
-			[11,17,23,29],
-			[17,23,29,35],
-			[6,12,18,24],
-			[12,18,24,30],
-			[18,24,30,36],
-			[13,19,25,31],
-			[19,25,31,37],
-			[20,26,32,38],
-
-			[3,11,19,27],
-			[2,10,18,26],
-			[10,18,26,34],
-			[1,9,17,25],
-			[9,17,25,33],
-			[17,25,33,41],
-			[0,8,16,24],
-			[8,16,24,32],
-			[16,24,32,40],
-			[7,15,23,31],
-			[15,23,31,39],
-			[14,22,30,38],
-			]
 		self.playerTurn = playerTurn
-		self.binary = self._binary()
-		self.id = self._convertStateToId()
-		self.allowedActions = self._allowedActions()
-		self.isEndGame = self._checkForEndGame()
-		self.value = self._getValue()
-		self.score = self._getScore()
+		self._canonical = None
+
+	def __setstate__(self, state):
+		if isinstance(state, dict):
+			# the __dict__ of a GameState pickled before __slots__, its derived attributes are stale
+			self.__init__(state['board'], state['playerTurn'])
+		else:
+			for name, value in state[1].items():
+				setattr(self, name, value)
+
+	@cachedProperty
+	def binary(self):
+		return self._binary()
+
+	@cachedProperty
+	def id(self):
+		return self._convertStateToId()
+
+	@cachedProperty
+	def allowedActions(self):
+		return self._allowedActions()
+
+	@cachedProperty
+	def isEndGame(self):
+		return self._checkForEndGame()
+
+	@cachedProperty
+	def value(self):
+		return self._getValue()
+
+	@cachedProperty
+	def score(self):
+		return self._getScore()
 
 	def _allowedActions(self):
 		allowed = []
@@ -166,17 +214,14 @@ class GameState():
 		return (position)
 
 	def _convertStateToId(self):
-		player1_position = np.zeros(len(self.board), dtype=np.int)
-		player1_position[self.board==1] = 1
-
-		other_position = np.zeros(len(self.board), dtype=np.int)
-		other_position[self.board==-1] = 1
+		# one bit per cell for each player, packed into 11 bytes
+		return np.packbits(np.concatenate((self.board==1, self.board==-1))).tobytes()
 
-		position = np.append(player1_position,other_position)
-
-		id = ''.join(map(str,position))
-
-		return id
+	def canonical(self):
+		'''Return (key, perm), the key is shared by every mirror image of this state, see Symmetries.canonical'''
+		if self._canonical is None:
+			self._canonical = SYMMETRIES.canonical(self.board)
+		return self._canonical
 
 	def _checkForEndGame(self):
 		if np.count_nonzero(self.board) == 42:
@@ -229,3 +274,102 @@ class GameState():
 
 
 
+def _hasFour(bitboard):
+	# vertical, horizontal and both diagonals, the sentinel bits stop lines wrapping around columns
+	for shift in (1, 7, 6, 8):
+		pairs = bitboard & (bitboard >> shift)
+		if pairs & (pairs >> (2 * shift)):
+			return True
+	return False
+
+
+def _packBitboards(bitboards, columns):
+	'''Return the id of the board of bitboards, its bitboard column i put in the board column columns[i]'''
+	player1, other = (sum(COLUMN_IDS[c][bitboard >> (7 * i) & 63] for i, c in enumerate(columns)) for bitboard in bitboards)
+	return ((player1 << 42 | other) << 4).to_bytes(11, 'big')
+
+
+class BitboardGameState(GameState):
+	'''GameState backed by one bitboard per player and the column heights.
+
+	Wins are found with shifts and masks and moves are generated per column.
+	The interface is the one of GameState, actions are still board cells.
+	'''
+	__slots__ = ('bitboards', 'heights', 'lost', '_cachedBoard')
+
+	def __init__(self, board, playerTurn):
+		board = np.asarray(board)
+		bitboards = tuple(sum(1 << int(b) for b in CELL_BITS[board == p]) for p in (1, -1))
+		heights = tuple(np.count_nonzero(board.reshape(6, 7), axis=0))
+		self._setup(bitboards, heights, playerTurn, board)
+
+	@classmethod
+	def _fromBitboards(cls, bitboards, heights, playerTurn):
+		state = cls.__new__(cls)
+		state._setup(bitboards, heights, playerTurn)
+		return state
+
+	def _setup(self, bitboards, heights, playerTurn, board=None):
+		self.bitboards = bitboards # player 1, player -1
+		self.heights = heights
+		self.playerTurn = playerTurn
+		if board is not None:
+			self._cachedBoard = board
+		self.lost = _hasFour(self.bitboards[0 if playerTurn == -1 else 1]) # the previous player connected four
+		self._canonical = None
+
+	@cachedProperty
+	def board(self):
+		return self._convertBitboardsToBoard()
+
+	def _convertBitboardsToBoard(self):
+		player1 = (np.uint64(self.bitboards[0]) >> CELL_BITS) & np.uint64(1)
+		other = (np.uint64(self.bitboards[1]) >> CELL_BITS) & np.uint64(1)
+		return player1.astype(np.int) - other.astype(np.int)
+
+	def _allowedActions(self):
+		return sorted(7 * (5 - h) + c for c, h in enumerate(self.heights) if h < 6)
+
+	def _convertStateToId(self):
+		return _packBitboards(self.bitboards, range(7))
+
+	def canonical(self):
+		# SYMMETRIES.canonical on the bitboards, the mirror image reverses the order of the columns
+		if self._canonical is None:
+			mirror = _packBitboards(self.bitboards, range(6, -1, -1))
+			self._canonical = (mirror, SYMMETRIES.inverse[1]) if mirror < self.id else (self.id, None)
+		return self._canonical
+
+	def __reduce__(self):
+		# board is a read-only cachedProperty, so rebuild from the bitboards rather than restore the slots
+		return (self._fromBitboards, (self.bitboards, self.heights, self.playerTurn))
+
+	def _checkForEndGame(self):
+		if self.lost or sum(self.heights) == 42:
+			return 1
+		return 0
+
+	def _getValue(self):
+		if self.lost:
+			return (-1, -1, 1)
+		return (0, 0, 0)
+
+	def takeAction(self, action):
+		column = action % 7
+		bit = 1 << (7 * column + self.heights[column])
+		if self.playerTurn == 1:
+			bitboards = (self.bitboards[0] | bit, self.bitboards[1])
+		else:
+			bitboards = (self.bitboards[0], self.bitboards[1] | bit)
+		heights = self.heights[:column] + (self.heights[column] + 1,) + self.heights[column+1:]
+
+		newState = BitboardGameState._fromBitboards(bitboards, heights, -self.playerTurn)
+
+		value = 0
+		done = 0
+
+		if newState.isEndGame:
+			value = newState.value[0]
+			done = 1
+
+		return (newState, value, done)
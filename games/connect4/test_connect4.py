@@ -0,0 +1,81 @@
+import copy
+import importlib.util
+import os
+import pickle
+import random
+import sys
+import unittest
+
+import numpy as np
+
+spec = importlib.util.spec_from_file_location('connect4_game', os.path.join(os.path.dirname(__file__), 'game.py'))
+game = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = game # pickle finds the classes by module name
+spec.loader.exec_module(game)
+
+def legacyPickle(**attributes):
+    '''Pickle a GameState like before __slots__, with the attributes in its __dict__'''
+    slotted = game.GameState
+    game.GameState = type('GameState', (), {'__module__': game.__name__})
+    try:
+        state = game.GameState()
+        state.__dict__.update(attributes)
+        return pickle.dumps(state)
+    finally:
+        game.GameState = slotted
+
+class TestBitboardGameState(unittest.TestCase):
+    def assertSameState(self, bitboard, state):
+        self.assertEqual(bitboard.allowedActions, state.allowedActions)
+        self.assertEqual(bitboard.id, state.id)
+        key, perm = bitboard.canonical()
+        self.assertEqual(key, state.canonical()[0])
+        self.assertEqual(perm is None, state.canonical()[1] is None)
+        self.assertEqual(bitboard.binary.tolist(), state.binary.tolist())
+        self.assertEqual(bitboard.isEndGame, state.isEndGame)
+        self.assertEqual(bitboard.value, state.value)
+        self.assertEqual(bitboard.board.tolist(), state.board.tolist())
+
+    def test_random_games(self):
+        random.seed(0)
+        for _ in range(50):
+            state = game.Game(bitboard=False).reset()
+            bitboard = game.Game(bitboard=True).reset()
+            done = 0
+            while not done:
+                self.assertSameState(bitboard, state)
+                action = random.choice(state.allowedActions)
+                state, value, done = state.takeAction(action)
+                bitboard, bvalue, bdone = bitboard.takeAction(action)
+                self.assertEqual((bvalue, bdone), (value, done))
+            self.assertSameState(bitboard, state)
+
+    def test_from_board(self):
+        board = np.zeros(42, dtype=int)
+        board[[35, 36, 28]] = 1
+        board[[41, 40]] = -1
+        state, bitboard = game.GameState(board, -1), game.BitboardGameState(board, -1)
+        self.assertSameState(bitboard, state)
+
+    def test_pickle_and_copy(self):
+        bitboard = game.Game(bitboard=True).reset()
+        for action in (38, 37, 31):
+            bitboard, _, _ = bitboard.takeAction(action)
+        state = game.GameState(bitboard.board, bitboard.playerTurn)
+        for restored in (pickle.loads(pickle.dumps(bitboard)), copy.copy(bitboard), copy.deepcopy(bitboard)):
+            self.assertIs(type(restored), game.BitboardGameState)
+            self.assertEqual((restored.bitboards, restored.heights), (bitboard.bitboards, bitboard.heights))
+            self.assertSameState(restored, state)
+
+    def test_legacy_pickle(self):
+        board = np.zeros(42, dtype=int)
+        board[[38, 31]] = 1
+        board[37] = -1
+        legacy = legacyPickle(board=board, playerTurn=-1, id='stale', allowedActions=[], isEndGame=1, winners=[])
+        state = pickle.loads(legacy)
+        self.assertIs(type(state), game.GameState)
+        self.assertSameState(state, game.GameState(board, -1))
+        self.assertSameState(pickle.loads(pickle.dumps(state)), state)
+
+if __name__ == '__main__':
+    unittest.main()
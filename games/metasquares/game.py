@@ -1,6 +1,92 @@
 import numpy as np
 import logging
 
+from utils import cachedProperty, Symmetries
+
+def _dihedral(grid):
+	grids = []
+	for k in range(4):
+		grids.append(np.rot90(grid, k))
+		grids.append(np.rot90(grid, k)[:, ::-1])
+	return grids
+
+SYMMETRIES = Symmetries([g.flatten() for g in _dihedral(np.arange(25).reshape(5, 5))])
+
+WINNERS = [
+	{'points': 1, 'tiles' : [
+	[0,1,5,6]
+	,[1,2,6,7]
+	,[2,3,7,8]
+	,[3,4,8,9]
+	,[5,6,10,11]
+	,[6,7,11,12]
+	,[7,8,12,13]
+	,[8,9,13,14]
+	,[10,11,15,16]
+	,[11,12,16,17]
+	,[12,13,17,18]
+	,[13,14,18,19]
+	,[15,16,20,21]
+	,[16,17,21,22]
+	,[17,18,22,23]
+	,[18,19,23,24]
+	]},
+	{'points': 2, 'tiles' : [
+	[1,5,7,11]
+	,[2,6,8,12]
+	,[3,7,9,13]
+	,[6,10,12,16]
+	,[7,11,13,17]
+	,[8,12,14,18]
+	,[11,15,17,21]
+	,[12,16,18,22]
+	,[13,17,19,23]
+	]},
+	{'points': 4, 'tiles' : [
+	[0,2,10,12]
+	,[1,3,11,13]
+	,[2,4,12,14]
+	,[5,7,15,17]
+	,[6,8,16,18]
+	,[7,9,17,19]
+	,[10,12,20,22]
+	,[11,13,21,23]
+	,[12,14,22,24]
+	]},
+	{'points': 5, 'tiles' : [
+	[1,10,8,17]
+	,[6,15,13,22]
+	,[2,11,9,18]
+	,[7,16,14,23]
+	,[2,5,13,16]
+	,[7,10,18,21]
+	,[3,6,14,17]
+	,[8,11,19,22]
+	]},
+	{'points': 8, 'tiles' : [
+	[2,10,14,22]
+	]},
+	{'points': 9, 'tiles' : [
+	[0,3,15,18]
+	,[1,4,16,19]
+	,[5,8,20,23]
+	,[6,9,21,24]
+	]},
+	{'points': 10, 'tiles' : [
+	[1,9,23,15]
+	,[5,3,19,21]
+	]},
+	{'points': 16, 'tiles' : [
+	[0,4,20,24]
+	]},
+	]
+
+# WINNERS flattened, the tiles of every square as an index matrix and the points of each square
+SQUARES = np.array([tiles for squareType in WINNERS for tiles in squareType['tiles']])
+SQUARE_POINTS = np.array([squareType['points'] for squareType in WINNERS for tiles in squareType['tiles']])
+# the squares going through each cell
+CELL_SQUARES = [np.where((SQUARES == cell).any(axis=1))[0] for cell in range(25)]
+
 class Game:
 
 	def __init__(self):		
@@ -94,84 +180,49 @@ class Game:
 
 
 class GameState():
-	def __init__(self, board, playerTurn):
+	__slots__ = ('board', 'playerTurn', 'points', '_canonical', '_cachedBinary', '_cachedId', '_cachedAllowedActions'
+		, '_cachedIsEndGame', '_cachedValue', '_cachedScore')
+
+	pieces = {'1':'X', '0': '-', '-1':'O'}
+
+	def __init__(self, board, playerTurn, points=None):
 		self.board = board
-		self.pieces = {'1':'X', '0': '-', '-1':'O'}
-		self.winners = [
-			{'points': 1, 'tiles' : [
-			[0,1,5,6]
-			,[1,2,6,7]
-			,[2,3,7,8]
-			,[3,4,8,9]
-			,[5,6,10,11]
-			,[6,7,11,12]
-			,[7,8,12,13]
-			,[8,9,13,14]
-			,[10,11,15,16]
-			,[11,12,16,17]
-			,[12,13,17,18]
-			,[13,14,18,19]
-			,[15,16,20,21]
-			,[16,17,21,22]
-			,[17,18,22,23]
-			,[18,19,23,24]
-			]},
-			{'points': 2, 'tiles' : [
-			[1,5,7,11]
-			,[2,6,8,12]
-			,[3,7,9,13]
-			,[6,10,12,16]
-			,[7,11,13,17]
-			,[8,12,14,18]
-			,[11,15,17,21]
-			,[12,16,18,22]
-			,[13,17,19,23]
-			]},
-			{'points': 4, 'tiles' : [
-			[0,2,10,12]
-			,[1,3,11,13]
-			,[2,4,12,14]
-			,[5,7,15,17]
-			,[6,8,16,18]
-			,[7,9,17,19]
-			,[10,12,20,22]
-			,[11,13,21,23]
-			,[12,14,22,24]
-			]},
-			{'points': 5, 'tiles' : [
-			[1,10,8,17]
-			,[6,15,13,22]
-			,[2,11,9,18]
-			,[7,16,14,23]
-			,[2,5,13,16]
-			,[7,10,18,21]
-			,[3,6,14,17]
-			,[8,11,19,22]
-			]},
-			{'points': 8, 'tiles' : [
-			[2,10,14,22]
-			]},
-			{'points': 9, 'tiles' : [
-			[0,3,15,18]
-			,[1,4,16,19]
-			,[5,8,20,23]
-			,[6,9,21,24]
-			]},
-			{'points': 10, 'tiles' : [
-			[1,9,23,15]
-			,[5,3,19,21]
-			]},
-			{'points': 16, 'tiles' : [
-			[0,4,20,24]
-			]},
-			]
 		self.playerTurn = playerTurn
-		self.binary = self._binary()
-		self.id = self._convertStateToId()
-		self.allowedActions = self._allowedActions()
-		self.isEndGame = self._checkForEndGame()
-		self.value = self._getValue()
-		self.score = self._getScore()
+		# running points of player 1 and player -1, takeAction passes them on updated
+		self.points = self._getPoints() if points is None else points
+		self._canonical = None
+
+	def __setstate__(self, state):
+		if isinstance(state, dict):
+			# the __dict__ of a GameState pickled before __slots__, its derived attributes are stale
+			self.__init__(state['board'], state['playerTurn'])
+		else:
+			for name, value in state[1].items():
+				setattr(self, name, value)
+
+	@cachedProperty
+	def binary(self):
+		return self._binary()
+
+	@cachedProperty
+	def id(self):
+		return self._convertStateToId()
+
+	@cachedProperty
+	def allowedActions(self):
+		return self._allowedActions()
+
+	@cachedProperty
+	def isEndGame(self):
+		return self._checkForEndGame()
+
+	@cachedProperty
+	def value(self):
+		return self._getValue()
+
+	@cachedProperty
+	def score(self):
+		return self._getScore()
 
 	def _allowedActions(self):
 		return np.where(self.board == 0)[0]
@@ -189,17 +240,14 @@ class GameState():
 		return (position)
 
 	def _convertStateToId(self):
-		player1_position = np.zeros(len(self.board), dtype=np.int)
-		player1_position[self.board==1] = 1
-
-		other_position = np.zeros(len(self.board), dtype=np.int)
-		other_position[self.board==-1] = 1
-
-		position = np.append(player1_position,other_position)
-
-		id = ''.join(map(str,position))
+		# one bit per cell for each player, packed into 7 bytes
+		return np.packbits(np.concatenate((self.board==1, self.board==-1))).tobytes()
 
-		return id
+	def canonical(self):
+		'''Return (key, perm), the key is shared by every rotation and reflection of this state, see Symmetries.canonical'''
+		if self._canonical is None:
+			self._canonical = SYMMETRIES.canonical(self.board)
+		return self._canonical
 
 
 
@@ -209,32 +257,15 @@ class GameState():
 			return 1
 		return 0
 
+	def _getPoints(self):
+		squares = self.board[SQUARES].sum(axis=1)
+		return (int(SQUARE_POINTS[squares == 4].sum()), int(SQUARE_POINTS[squares == -4].sum()))
+
 	def _getValue(self):
-		currentPlayerPoints = 0
-		for squareType in self.winners:
-			points = squareType['points']
-			for tiles in squareType['tiles']:
-				checkFlag = 0
-				tilenum = 0
-				while tilenum < 4 and checkFlag == 0:
-					if self.board[tiles[tilenum]] != self.playerTurn:
-						checkFlag = 1
-					tilenum = tilenum + 1
-				if checkFlag == 0:
-					currentPlayerPoints = currentPlayerPoints + points
-					
-		opponentPlayerPoints = 0
-		for squareType in self.winners:
-			points = squareType['points']
-			for tiles in squareType['tiles']:
-				checkFlag = 0
-				tilenum = 0
-				while tilenum < 4 and checkFlag == 0:
-					if self.board[tiles[tilenum]] != -self.playerTurn:
-						checkFlag = 1
-					tilenum = tilenum + 1
-				if checkFlag == 0:
-					opponentPlayerPoints = opponentPlayerPoints + points
+		if self.playerTurn == 1:
+			currentPlayerPoints, opponentPlayerPoints = self.points
+		else:
+			opponentPlayerPoints, currentPlayerPoints = self.points
 
 		if currentPlayerPoints > opponentPlayerPoints:
 			return (1, currentPlayerPoints, opponentPlayerPoints)
@@ -251,7 +282,17 @@ class GameState():
 	def takeAction(self, action):
 		newBoard = np.array(self.board)
 		newBoard[action] = self.playerTurn
-		newState = GameState(newBoard, -self.playerTurn)
+
+		# only the squares through the new tile can have been completed
+		squares = CELL_SQUARES[action]
+		completed = (newBoard[SQUARES[squares]] == self.playerTurn).all(axis=1)
+		gained = int(SQUARE_POINTS[squares][completed].sum())
+		if self.playerTurn == 1:
+			points = (self.points[0] + gained, self.points[1])
+		else:
+			points = (self.points[0], self.points[1] + gained)
+
+		newState = GameState(newBoard, -self.playerTurn, points)
 
 		value = 0
 		done = 0
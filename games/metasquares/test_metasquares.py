@@ -0,0 +1,53 @@
+import importlib.util
+import os
+import pickle
+import random
+import sys
+import unittest
+
+spec = importlib.util.spec_from_file_location('metasquares_game', os.path.join(os.path.dirname(__file__), 'game.py'))
+game = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = game # pickle finds the classes by module name
+spec.loader.exec_module(game)
+
+def legacyPickle(**attributes):
+    '''Pickle a GameState like before __slots__, with the attributes in its __dict__'''
+    slotted = game.GameState
+    game.GameState = type('GameState', (), {'__module__': game.__name__})
+    try:
+        state = game.GameState()
+        state.__dict__.update(attributes)
+        return pickle.dumps(state)
+    finally:
+        game.GameState = slotted
+
+class TestPoints(unittest.TestCase):
+    def test_random_games(self):
+        random.seed(0)
+        scored = 0
+        for _ in range(50):
+            state = game.Game().reset()
+            done = 0
+            while not done:
+                state, value, done = state.takeAction(random.choice(state.allowedActions))
+                # the running points against a recount of every square
+                self.assertEqual(state.points, state._getPoints())
+                self.assertEqual(state.value, game.GameState(state.board, state.playerTurn).value)
+            scored += sum(state.points) > 0
+        self.assertGreater(scored, 0)
+
+    def test_legacy_pickle(self):
+        random.seed(1)
+        state = game.Game().reset()
+        while sum(state.points) == 0:
+            state, _, _ = state.takeAction(random.choice(state.allowedActions))
+        legacy = legacyPickle(board=state.board, playerTurn=state.playerTurn, id='stale', value=(0, 0, 0), winners=[])
+        restored = pickle.loads(legacy)
+        self.assertIs(type(restored), game.GameState)
+        self.assertEqual(restored.points, state.points)
+        self.assertEqual((restored.id, restored.value), (state.id, state.value))
+        restored = pickle.loads(pickle.dumps(state))
+        self.assertEqual((restored.points, restored.id), (state.points, state.id))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,13 @@
 import functools
 import random
 import itertools
-import copy
 import sys
 from enum import Enum, auto
 from collections import Counter
 import numpy as np
 
+from utils import cachedProperty
+
 MAX_STONES_LIMIT = 10
 MAX_HAND_STONES = 10
 MAX_PLAYERS = 4
@@ -236,6 +237,14 @@ class Player(dict):
         self[PlayerElement.NOBLE] = []
         self[PlayerElement.FOLD] = []
 
+    def copy(self):
+        player = Player.__new__(Player)
+        dict.update(player, self)
+        player[PlayerElement.STONE] = Stones(self[PlayerElement.STONE])
+        for ele in (PlayerElement.CARD, PlayerElement.NOBLE, PlayerElement.FOLD):
+            player[ele] = list(self[ele])
+        return player
+
     def win(self):
         return self.score >= WIN_SCORE
 
@@ -247,25 +256,12 @@ class Player(dict):
         return score
 
     def binary(self, b):
-        cards_position = np.zeros(len(b[Position.CARDS]), dtype=np.int)
-        for c in self[PlayerElement.CARD]:
-            cards_position[c.id] = 1
-        for c in self[PlayerElement.FOLD]:
-            cards_position[c.id] = 1
-        nobles_position = np.zeros(len(b[Position.NOBLES]), dtype=np.int)
-        for n in self[PlayerElement.NOBLE]:
-            nobles_position[n.id] = 1
-        '''stones_position:
-         0 1 2 3 4 5 ... 10   # number
-        [0 0 0 0 1 ...   0 ], # GOLD
-        ...
-        '''
-        stones_position = np.array([], dtype=np.int)
-        for x in sorted(self[PlayerElement.STONE].items(), key=lambda x:x[0].value):
-            t = np.zeros(MAX_STONES_LIMIT, dtype=np.int)
-            t[x[1]] = 1
-            stones_position = np.append(stones_position, t)
-        return np.concatenate((cards_position, nobles_position, stones_position))
+        '''Cards held or folded, nobles, then a one-hot stone count per color, see encodeStates'''
+        position = np.zeros(PLAYER_FEATURES, dtype=np.uint8)
+        position[[c.id for c in self[PlayerElement.CARD] + self[PlayerElement.FOLD]]] = 1
+        position[[CARD_FEATURES + n.id for n in self[PlayerElement.NOBLE]]] = 1
+        position[STONE_OFFSETS + stonesToArray(self[PlayerElement.STONE])] = 1
+        return position
 
 class Board(dict):
 
@@ -298,24 +294,58 @@ class Board(dict):
         self[Position.HALL] = nobles[:max_noble]
         self[Position.OUT_OF_GAME] = nobles[max_noble:]
         self[Position.PLAYER_POS] = [Player() for _ in range(player_num)]
+        self[Position.DO_NOTHING] = 0
+
+    def copy(self):
+        '''Copy everything an action can change, Card and Noble objects are shared'''
+        board = Board.__new__(Board)
+        dict.update(board, self)
+        for pos in (Position.DECK1, Position.DECK2, Position.DECK3,
+                    Position.LINE1, Position.LINE2, Position.LINE3, Position.HALL):
+            board[pos] = list(self[pos])
+        board[Position.STONE] = Stones(self[Position.STONE])
+        board[Position.PLAYER_POS] = [p.copy() for p in self[Position.PLAYER_POS]]
+        return board
+
+    @staticmethod
+    def save(record, container, *keys):
+        '''Append the current values of container[key] to an undo record'''
+        for key in keys:
+            value = container[key]
+            if isinstance(value, Stones):
+                value = Stones(value)
+            elif isinstance(value, list):
+                value = list(value)
+            record.append((container, key, value))
+
+    def apply(self, action):
+        '''Play action in place and pass the turn, returns the record to undo it with.
+
+        The record also covers the do nothing counter that a GameState built
+        on this board updates.
+        '''
+        record = []
+        Board.save(record, self, 'turn', Position.DO_NOTHING)
+        record += action.apply(self)
+        self['turn'] = (action.playerTurn + 1) % len(self[Position.PLAYER_POS])
+        return record
+
+    def undo(self, record):
+        '''Roll back the changes of an undo record, a record can only be undone once'''
+        for container, key, value in reversed(record):
+            container[key] = value
 
     def binary(self):
-        cards_position = np.zeros(len(self[Position.CARDS]), dtype=np.int)
+        '''Position value per card, nobles in the hall, then a one-hot stone count per color'''
+        position = np.zeros(PLAYER_FEATURES, dtype=np.uint8)
         for pos in (Position.DECK1, Position.DECK2, Position.DECK3,
                     Position.LINE1, Position.LINE2, Position.LINE3):
-            for c in self[pos]:
-                cards_position[c.id] = pos.value
-        nobles_position = np.zeros(len(self[Position.NOBLES]), dtype=np.int)
-        for n in self[Position.HALL]:
-            nobles_position[n.id] = 1
-        stones_position = np.array([], dtype=np.int)
-        for x in sorted(self[Position.STONE].items(), key=lambda x:x[0].value):
-            t = np.zeros(MAX_STONES_LIMIT, dtype=np.int)
-            t[x[1]] = 1
-            stones_position = np.append(stones_position, t)
-        return np.concatenate((cards_position, nobles_position, stones_position))
-
-    def draw(self, card):
+            position[[c.id for c in self[pos]]] = pos.value
+        position[[CARD_FEATURES + n.id for n in self[Position.HALL]]] = 1
+        position[STONE_OFFSETS + stonesToArray(self[Position.STONE])] = 1
+        return position
+
+    def draw(self, card, record=None):
         '''Remove card from some line and draw new card from deck'''
         for deck, line in [
             (Position.DECK1, Position.LINE1),
@@ -323,6 +353,8 @@ class Board(dict):
             (Position.DECK3, Position.LINE3),
         ]:
             if card in self[line]:
+                if record is not None:
+                    Board.save(record, self, deck, line)
                 self[line].remove(card)
                 self._trans(deck, line)
 
@@ -331,6 +363,156 @@ class Board(dict):
             self[to].append(self[from_][0])
             self[from_] = self[from_][1:]
 
+# colors by index, index i holds Color(i)
+COLORS = [Color.GOLD] + [Color(c) for c in Color.ALL.value]
+# location codes of the cards and nobles held by player p are PLAYER_CARD + p and PLAYER_FOLD + p
+PLAYER_CARD = 16
+PLAYER_FOLD = PLAYER_CARD + MAX_PLAYERS
+# static card and noble tables indexed by id, costs are indexed by color
+CARD_NEED = np.array([[c.need[color] for color in COLORS] for c in sum(map(list, Cards().values()), [])], dtype=np.int8)
+CARD_COLOR = np.array([c.color.value for c in sum(map(list, Cards().values()), [])], dtype=np.int8)
+NOBLE_NEED = np.array([[n.need[color] for color in COLORS] for n in Nobles()], dtype=np.int8)
+CARD_SCORE = np.array([c.score for c in sum(map(list, Cards().values()), [])], dtype=np.int32)
+NOBLE_SCORE = np.array([n.score for n in Nobles()], dtype=np.int32)
+# Zobrist keys of the position features, see ArrayBoard.key
+_zobrist = np.random.RandomState(2018)
+def _zobristKeys(*shape):
+    return _zobrist.randint(0, 2**64, size=shape, dtype=np.uint64)
+ZOBRIST_CARD = _zobristKeys(len(CARD_NEED), PLAYER_FOLD + MAX_PLAYERS)
+ZOBRIST_DECK = _zobristKeys(len(CARD_NEED), len(CARD_NEED))
+ZOBRIST_NOBLE = _zobristKeys(len(NOBLE_NEED), PLAYER_FOLD + MAX_PLAYERS)
+ZOBRIST_STONES = _zobristKeys(MAX_PLAYERS + 1, len(COLORS), MAX_STONES_LIMIT + 1)
+ZOBRIST_TURN = _zobristKeys(MAX_PLAYERS)
+ZOBRIST_PLAYER = _zobristKeys(MAX_PLAYERS)
+ZOBRIST_DO_NOTHING = _zobristKeys(MAX_PLAYERS + 1)
+# features of one player: cards held or folded by id, nobles by id, then the one-hot stone counts
+CARD_FEATURES = len(CARD_NEED)
+STONE_OFFSETS = CARD_FEATURES + len(NOBLE_NEED) + MAX_STONES_LIMIT * np.arange(len(COLORS))
+PLAYER_FEATURES = CARD_FEATURES + len(NOBLE_NEED) + MAX_STONES_LIMIT * len(COLORS)
+# PLAYER_ORDERS[n][p] are the players of an n player game in feature order with p to move,
+# PLAYER_RANKS[n][p] the feature row of every player
+PLAYER_ORDERS = {n: np.array([[p] + [i for i in range(n) if i != p] for p in range(n)]) for n in range(1, MAX_PLAYERS + 1)}
+PLAYER_RANKS = {n: np.argsort(orders, axis=1) for n, orders in PLAYER_ORDERS.items()}
+
+def stonesToArray(stones):
+    return np.array([stones[c] for c in COLORS], dtype=np.int8)
+
+class ArrayBoard(object):
+    '''Board as fixed size arrays.
+
+    stones and playerStones hold stone counts by color index, cardLocation
+    holds a Position value (decks and lines) or PLAYER_CARD/PLAYER_FOLD + p
+    per card id, nobleLocation a Position value (hall or out of game) or
+    PLAYER_CARD + p per noble id. cardOrder is the index of every card in
+    its Board list. Card and noble costs come from the static CARD_NEED and
+    NOBLE_NEED tables. It only describes a position, the rules play on Board.
+    '''
+    __slots__ = ('stones', 'playerStones', 'cardLocation', 'cardOrder', 'nobleLocation', 'turn', 'doNothing')
+
+    @classmethod
+    def fromBoard(cls, board):
+        ab = cls.__new__(cls)
+        players = board[Position.PLAYER_POS]
+        ab.stones = stonesToArray(board[Position.STONE])
+        ab.playerStones = np.array([stonesToArray(p[PlayerElement.STONE]) for p in players])
+        cards = [(board[pos], pos.value) for pos in
+            (Position.DECK1, Position.DECK2, Position.DECK3, Position.LINE1, Position.LINE2, Position.LINE3)]
+        nobles = [(board[Position.HALL], Position.HALL.value), (board[Position.OUT_OF_GAME], Position.OUT_OF_GAME.value)]
+        for idx, p in enumerate(players):
+            cards.append((p[PlayerElement.CARD], PLAYER_CARD + idx))
+            cards.append((p[PlayerElement.FOLD], PLAYER_FOLD + idx))
+            nobles.append((p[PlayerElement.NOBLE], PLAYER_CARD + idx))
+        ab.cardLocation, ab.cardOrder = ab._locate(len(CARD_NEED), cards)
+        ab.nobleLocation, _ = ab._locate(len(NOBLE_NEED), nobles)
+        ab.turn = board['turn']
+        ab.doNothing = board.get(Position.DO_NOTHING, 0)
+        return ab
+
+    @staticmethod
+    def _locate(size, lists):
+        '''Location codes and orders by id of the items in (items, code) lists'''
+        location = [0] * size
+        order = [0] * size
+        for items, code in lists:
+            for idx, item in enumerate(items):
+                location[item.id] = code
+                order[item.id] = idx
+        return np.array(location, dtype=np.int8), np.array(order, dtype=np.int32)
+
+    def deckDepth(self):
+        '''Distance of every deck card from the bottom of its deck, -1 for the other cards.
+
+        Draws only take the top card, the depths of the cards left never change.
+        '''
+        depth = np.full(len(self.cardLocation), -1, dtype=np.int8)
+        for deck in (Position.DECK1, Position.DECK2, Position.DECK3):
+            ids = np.where(self.cardLocation == deck.value)[0]
+            depth[ids[np.argsort(self.cardOrder[ids])[::-1]]] = np.arange(len(ids))
+        return depth
+
+    def key(self, playerTurn):
+        '''64 bit Zobrist key of the position with playerTurn to move.
+
+        It covers what the rules can tell apart: where every card and noble
+        is, the order of the decks, the stones, the turn and the do nothing
+        counter, but not the order of the lines and of the player hands.
+        '''
+        cards = np.arange(len(self.cardLocation))
+        depth = self.deckDepth()
+        inDeck = depth >= 0
+        stones = np.vstack((self.stones, self.playerStones))
+        key = np.bitwise_xor.reduce(ZOBRIST_CARD[cards[~inDeck], self.cardLocation[~inDeck]]) \
+            ^ np.bitwise_xor.reduce(ZOBRIST_DECK[cards[inDeck], depth[inDeck]]) \
+            ^ np.bitwise_xor.reduce(ZOBRIST_NOBLE[np.arange(len(self.nobleLocation)), self.nobleLocation]) \
+            ^ np.bitwise_xor.reduce(ZOBRIST_STONES[np.arange(len(stones))[:, None], np.arange(len(COLORS)), stones].ravel()) \
+            ^ ZOBRIST_TURN[self.turn] ^ ZOBRIST_PLAYER[playerTurn] ^ ZOBRIST_DO_NOTHING[self.doNothing]
+        return int(key)
+
+    def encoding(self, playerTurn):
+        '''The features key hashes as bytes, to check keys for collisions'''
+        return b''.join((self.cardLocation.tobytes(), self.deckDepth().tobytes(), self.nobleLocation.tobytes()
+            , self.stones.tobytes(), self.playerStones.tobytes(), bytes((self.turn, playerTurn, self.doNothing))))
+
+    def scores(self):
+        '''Points of every player, from the cards and nobles they hold'''
+        held = PLAYER_CARD + np.arange(len(self.playerStones))[:, None]
+        return (self.cardLocation == held) @ CARD_SCORE + (self.nobleLocation == held) @ NOBLE_SCORE
+
+    def bonus(self, playerTurn):
+        '''Stones provided by the cards of a player, by color index'''
+        return np.bincount(CARD_COLOR[self.cardLocation == PLAYER_CARD + playerTurn], minlength=len(COLORS))
+
+    def allowedActions(self, playerTurn, index):
+        '''Indices of the playable actions of playerTurn in the action list of index, an ActionIndex.
+
+        The actions whose is_playable accepts the Board, with do nothing only
+        when nothing else is playable.
+        '''
+        if playerTurn != self.turn:
+            return [int(index.doNothing[playerTurn])]
+        bank, stones = self.stones, self.playerStones[playerTurn]
+
+        picks = index.stones[playerTurn]
+        colors = np.count_nonzero(picks[:, 1:], axis=1)
+        playable = (picks[:, 0] == 0) & (picks <= bank).all(axis=1) & (colors <= 3) \
+            & ~((colors == 1) & ((picks >= 2) & (bank < 4)).any(axis=1)) \
+            & (stones.sum() + picks.sum(axis=1) <= MAX_HAND_STONES)
+        allowed = [index.pickStones[playerTurn][playable]]
+
+        inLine = (self.cardLocation >= Position.LINE1.value) & (self.cardLocation <= Position.LINE3.value)
+        folded = self.cardLocation == PLAYER_FOLD + playerTurn
+        # golds cover whatever the card bonuses and the stones do not
+        missing = np.maximum(CARD_NEED - self.bonus(playerTurn) - stones, 0)[:, 1:].sum(axis=1)
+        allowed.append(index.pickCard[playerTurn][(inLine | folded) & (missing <= stones[0])])
+        if np.count_nonzero(folded) < 3:
+            allowed.append(index.foldCard[playerTurn][inLine])
+
+        allowed = np.sort(np.concatenate(allowed))
+        allowed = allowed[allowed >= 0]
+        if len(allowed) == 0:
+            return [int(index.doNothing[playerTurn])]
+        return allowed.tolist()
+
 class ActionMeta(type):
     # is_playable will be called before subclass.is_playable
     def __new__(cls, name, bases, attrs):
@@ -357,6 +539,7 @@ class Action(object, metaclass=ActionMeta):
         return '%s(%s)' % (self.__class__.__name__, self)
 
     def apply(self, board):
+        '''Play the action on board in place, returns the undo record for Board.undo'''
         raise NotImplementedError
 
     def is_playable(self, board):
@@ -392,9 +575,13 @@ class PickStones(Action):
             raise NotFulfillError
         player = board[Position.PLAYER_POS][self.playerTurn]
         stones = self.card_or_stone
+        record = []
+        Board.save(record, board, Position.STONE)
+        Board.save(record, player, PlayerElement.STONE)
         for c, num in stones.items():
             board[Position.STONE][c] -= num
             player[PlayerElement.STONE][c] += num
+        return record
 
 class NotFulfillError(Exception):
     pass
@@ -402,6 +589,9 @@ class NotFulfillError(Exception):
 class DeadlockGameError(Exception):
     pass
 
+class IdCollisionError(Exception):
+    pass
+
 class PickCard(Action):
 
     def __init__(self, playerTurn, card):
@@ -420,19 +610,23 @@ class PickCard(Action):
         is_fulfill, removed_stones = card.fulfill(player[PlayerElement.STONE], player[PlayerElement.CARD])
         if not is_fulfill:
             raise NotFulfillError
+        record = []
+        Board.save(record, board, Position.STONE)
+        Board.save(record, player, PlayerElement.STONE, PlayerElement.CARD, PlayerElement.FOLD)
         player[PlayerElement.STONE] -= removed_stones
         board[Position.STONE] += removed_stones
         player[PlayerElement.CARD].append(card)
         if card in player[PlayerElement.FOLD]:
             player[PlayerElement.FOLD].remove(card)
         else:
-            board.draw(card)
+            board.draw(card, record)
         # If fulfill noble then acquire automatically
         for noble in board[Position.HALL]:
             if noble.fulfill(player[PlayerElement.CARD]):
                 pn = PickNoble(self.playerTurn, noble)
-                pn.apply(board)
+                record += pn.apply(board)
                 break  # Only pick one noble
+        return record
 
 class PickNoble(Action):
 
@@ -447,11 +641,15 @@ class PickNoble(Action):
         return noble in board[Position.HALL] and noble.fulfill(player[PlayerElement.CARD])
 
     def apply(self, board):
+        record = []
         if self.is_playable(board):
             player = board[Position.PLAYER_POS][self.playerTurn]
             noble = self.card_or_stone
+            Board.save(record, board, Position.HALL)
+            Board.save(record, player, PlayerElement.NOBLE)
             board[Position.HALL].remove(noble)
             player[PlayerElement.NOBLE].append(noble)
+        return record
 
 class FoldCard(Action):
 
@@ -470,11 +668,15 @@ class FoldCard(Action):
             raise NotFulfillError
         player = board[Position.PLAYER_POS][self.playerTurn]
         card = self.card_or_stone
+        record = []
+        Board.save(record, board, Position.STONE)
+        Board.save(record, player, PlayerElement.STONE, PlayerElement.FOLD)
         player[PlayerElement.FOLD].append(card)
         if board[Position.STONE][Color.GOLD] > 0:
             board[Position.STONE][Color.GOLD] -= 1
             player[PlayerElement.STONE][Color.GOLD] += 1
-        board.draw(card)
+        board.draw(card, record)
+        return record
 
 class DoNothing(Action):
     def __init__(self, playerTurn):
@@ -486,15 +688,125 @@ class DoNothing(Action):
     def apply(self, board):
         if not self.is_playable(board):
             raise NotFulfillError  # Never!
+        return []
+
+class ActionIndex(object):
+    '''Where each player's actions sit in an action list, for vectorized move generation.
+
+    doNothing[p] is an index, pickStones[p] the indices of the PickStones
+    actions with their stones in stones[p] by color index, pickCard[p][id]
+    and foldCard[p][id] the index of the action on card id (-1 if none).
+    '''
+
+    def __init__(self, actions):
+        players = max(a.playerTurn for a in actions) + 1
+        cards = max(a.card_or_stone.id for a in actions if a.typ == ActionType.PICK_CARD) + 1
+        self.doNothing = np.full(players, -1, dtype=np.int32)
+        self.pickCard = np.full((players, cards), -1, dtype=np.int32)
+        self.foldCard = np.full((players, cards), -1, dtype=np.int32)
+        pickStones = [[] for _ in range(players)]
+        for idx, act in enumerate(actions):
+            p = act.playerTurn
+            if act.typ == ActionType.DO_NOTHING:
+                self.doNothing[p] = idx
+            elif act.typ == ActionType.PICK_STONES:
+                pickStones[p].append(idx)
+            elif act.typ == ActionType.PICK_CARD:
+                self.pickCard[p][act.card_or_stone.id] = idx
+            elif act.typ == ActionType.FOLD_CARD:
+                self.foldCard[p][act.card_or_stone.id] = idx
+        self.pickStones = [np.array(idx, dtype=np.int32) for idx in pickStones]
+        self.stones = [np.array([stonesToArray(actions[i].card_or_stone) for i in idx]).reshape(-1, len(COLORS))
+            for idx in pickStones]
+
+class ActionSpace(object):
+    '''The policy indices of a player_num game.
+
+    Every player owns one block of blockSize actions laid out the same way.
+    An absolute space concatenates the blocks of all players, a relative one
+    is a single block standing for the actions of the player to move.
+    Legacy indices are the absolute indices of a MAX_PLAYERS game, which
+    also are the absolute indices of any smaller game.
+    '''
+    spaces = {}
+
+    def __init__(self, player_num, relative=False):
+        self.player_num = player_num
+        self.relative = relative
+        self.actions = GameState.build_all_actions(player_num)
+        self.index = ActionIndex(self.actions)
+        self.blockSize = len(self.actions) // player_num
+        self.size = self.blockSize if relative else len(self.actions)
+        self.blocks = [self.actions[p*self.blockSize:(p+1)*self.blockSize] for p in range(player_num)]
+
+    @classmethod
+    def get(cls, player_num, relative=False):
+        '''Shared ActionSpace for player_num and relative'''
+        key = (player_num, relative)
+        if key not in cls.spaces:
+            cls.spaces[key] = cls(player_num, relative)
+        return cls.spaces[key]
+
+    def actionsFor(self, playerTurn):
+        '''The actions by policy index when playerTurn is to move'''
+        return self.blocks[playerTurn] if self.relative else self.actions
+
+    def offset(self, playerTurn):
+        '''What to add to a policy index of playerTurn to get its absolute index'''
+        return playerTurn * self.blockSize if self.relative else 0
+
+    def toLegacy(self, action, playerTurn):
+        '''Legacy index of a policy index, action may be an int or an array'''
+        return action + self.offset(playerTurn)
+
+    def fromLegacy(self, legacy, playerTurn):
+        '''Policy index of a legacy index, legacy may be an int or an array'''
+        return legacy - self.offset(playerTurn)
+
+    def toLegacyPolicy(self, pi, playerTurn):
+        '''Spread a policy over the MAX_PLAYERS legacy action space'''
+        legacy = np.zeros(MAX_PLAYERS * self.blockSize, dtype=np.asarray(pi).dtype)
+        start = self.offset(playerTurn)
+        legacy[start:start + len(pi)] = pi
+        return legacy
+
+    def fromLegacyPolicy(self, legacy, playerTurn):
+        start = self.offset(playerTurn)
+        return np.array(legacy[start:start + self.size])
+
+def encodeStates(states):
+    '''Model inputs of states with the same player count as one (N, players * PLAYER_FEATURES) uint8 array.
+
+    Each state holds one row of features per player, the player to move first
+    and then the others in turn order.
+    '''
+    n = len(states[0].players)
+    boards = [s.arrayBoard for s in states]
+    turns = np.array([s.playerTurn for s in states])
+    cardLocation = np.array([ab.cardLocation for ab in boards])
+    nobleLocation = np.array([ab.nobleLocation for ab in boards])
+    playerStones = np.array([ab.playerStones for ab in boards])
+    ranks = PLAYER_RANKS[n][turns]
+    out = np.zeros((len(states), n, PLAYER_FEATURES), dtype=np.uint8)
+
+    # held and folded cards are both coded from PLAYER_CARD on
+    s, c = np.nonzero(cardLocation >= PLAYER_CARD)
+    out[s, ranks[s, (cardLocation[s, c] - PLAYER_CARD) % MAX_PLAYERS], c] = 1
+    s, c = np.nonzero(nobleLocation >= PLAYER_CARD)
+    out[s, ranks[s, nobleLocation[s, c] - PLAYER_CARD], CARD_FEATURES + c] = 1
+    stones = playerStones[np.arange(len(states))[:, None], PLAYER_ORDERS[n][turns]]
+    out[np.arange(len(states))[:, None, None], np.arange(n)[None, :, None], STONE_OFFSETS + stones] = 1
+    return out.reshape(len(states), -1)
 
 class Game(object):
 
-    def __init__(self, player_num=2, seed=0):
+    def __init__(self, player_num=2, seed=0, relative=False):
         self.name = 'splendor'
         self.player_num = player_num
         self.seed = seed
+        self.actionSpace = ActionSpace.get(player_num, relative)
         self.reset()
-        self.action_size = len(self.gameState.allActions)
+        self.action_size = self.actionSpace.size
         self.state_size = len(self.gameState.binary)
         self.input_shape = (player_num, 1, self.state_size // player_num)
         # self.grid_shape = (1, self.state_size // player_num)
@@ -505,7 +817,7 @@ class Game(object):
         random.seed(self.seed)
         self.board = Board(self.player_num)
         self.players = self.board[Position.PLAYER_POS]
-        self.gameState = GameState(self.board, self.playerTurn)
+        self.gameState = GameState(self.board, self.playerTurn, self.actionSpace)
         self.steps = []
         return self.gameState
 
@@ -526,47 +838,102 @@ class Game(object):
         return self.board[Position.PLAYER_POS][self.playerTurn]
 
 class GameState(object):
+    __slots__ = ('board', 'players', 'playerTurn', 'actionSpace', 'arrayBoard', 'deadlock', '_cachedBinary'
+        , '_cachedId', '_cachedAllowedActions', '_cachedFairTurn', '_cachedOutcome', '_cachedScore')
 
-    def __init__(self, board, playerTurn):
+    pieces = {'0': 'Alice', '1': 'Bob', '2': 'Claire', '3': 'Doggy'}
+    # set to a dict to check every id against the encoding it hashes, a collision raises IdCollisionError
+    idEncodings = None
+
+    def __init__(self, board, playerTurn, actionSpace=None):
         self.board = board
         self.players = board[Position.PLAYER_POS]
         self.playerTurn = playerTurn
-        self.pieces = {'0': 'Alice', '1': 'Bob', '2': 'Claire', '3': 'Doggy'}
-        self.binary = self._binary()
-        self.id = self._convertStateToId()
-        self.allowedActions = self._allowedActions()
-        self.fairTurn = False
-        self.winner, self.isEndGame = self._checkForEndGame()
+        # the absolute action space of the players on the board by default
+        self.actionSpace = ActionSpace.get(len(self.players)) if actionSpace is None else actionSpace
+        self.arrayBoard = ArrayBoard.fromBoard(board)
+        self.deadlock = self._countDoNothing()
         # self.value = self._getValue()
-        self.score = self._getScore()
+
+    # derived attributes come from the ArrayBoard snapshot taken at construction,
+    # they do not follow later changes of the board, e.g. Board.apply. takeAction
+    # copies the board itself, so undo any change before calling it.
+    # isEndGame and winner raise DeadlockGameError on a deadlock
+
+    @property
+    def allActions(self):
+        '''The actions by policy index'''
+        return self.actionSpace.actionsFor(self.playerTurn)
+
+    @cachedProperty
+    def binary(self):
+        return self._binary()
+
+    @cachedProperty
+    def id(self):
+        return self._convertStateToId()
+
+    @cachedProperty
+    def allowedActions(self):
+        return self._allowedActions()
+
+    @cachedProperty
+    def fairTurn(self):
+        return bool((self.arrayBoard.scores() >= WIN_SCORE).any())
+
+    @cachedProperty
+    def _outcome(self):
+        return self._checkForEndGame()
+
+    @property
+    def winner(self):
+        return self._outcome[0]
+
+    @property
+    def isEndGame(self):
+        return self._outcome[1]
+
+    @cachedProperty
+    def score(self):
+        return self._getScore()
 
     def _binary(self):
         '''First current player array, then player1(if is not current player) and so on'''
-        positions = np.array([], dtype=np.int)
-        positions = np.append(positions, self.players[self.playerTurn].binary(self.board))
-        for idx, p in enumerate(self.players):
-            if self.playerTurn != idx:
-                positions = np.append(positions, p.binary(self.board))
-        return positions
-
+        return encodeStates([self])[0]
 
     def _convertStateToId(self):
-        id_str = ''.join([str(p) for p in self.players])
-        id_str += str(self.board)
-        return id_str
-        # positions = np.array([], dtype=np.int)
-        # for p in self.players:
-            # positions = np.append(positions, p.binary(self.board))
-        # positions = np.append(positions, self.board.binary())
-        # return ','.join(map(str, positions))
+        key = self.arrayBoard.key(self.playerTurn)
+        if GameState.idEncodings is not None:
+            encoding = self.arrayBoard.encoding(self.playerTurn)
+            if GameState.idEncodings.setdefault(key, encoding) != encoding:
+                raise IdCollisionError(key)
+        return key
 
     #todo: how to restore from id?
     @classmethod
     def _convertIdToState(self, positions):
         pass
 
+    def _countDoNothing(self):
+        '''Count the turns in a row without a playable move on the board, returns True on a deadlock'''
+        # the move generator only offers do nothing when nothing else is playable
+        self._cachedAllowedActions = self._allowedActions()
+        doNothing = int(self.actionSpace.index.doNothing[self.playerTurn]) - self.actionSpace.offset(self.playerTurn)
+        if self._cachedAllowedActions != [doNothing]:
+            self.board[Position.DO_NOTHING] = 0
+            self.arrayBoard.doNothing = 0
+            return False
+        self.board[Position.DO_NOTHING] += 1
+        self.arrayBoard.doNothing = self.board[Position.DO_NOTHING]
+        return self.board[Position.DO_NOTHING] == len(self.players)
+
     def _allowedActions(self):
-        self.deadlock = False
+        allowed = self.arrayBoard.allowedActions(self.playerTurn, self.actionSpace.index)
+        offset = self.actionSpace.offset(self.playerTurn)
+        return [a - offset for a in allowed] if offset else allowed
+
+    def _allowedActionsLoop(self):
+        '''Reference move generator calling is_playable on every action'''
         allowed_actions = []
         do_nothing_id = None
         for idx, act in enumerate(self.allActions):
@@ -577,25 +944,15 @@ class GameState(object):
                 if act.is_playable(self.board):
                     allowed_actions.append(idx)
         if len(allowed_actions) == 0:
-            self.board[Position.DO_NOTHING] += 1
             allowed_actions.append(do_nothing_id)
-            if self.board[Position.DO_NOTHING] == len(self.players):
-                self.deadlock = True
-        else:
-            self.board[Position.DO_NOTHING] = 0
         return allowed_actions
 
     def _checkForEndGame(self):
         if self.deadlock:
             raise DeadlockGameError
-        players = self.board[Position.PLAYER_POS]
-        for p in players:
-            if p.win():
-                self.fairTurn = True
-        if self.fairTurn and self.playerTurn == len(players) - 1:
-            player_score = [(idx, p.score) for idx, p in enumerate(players)]
-            player_score = sorted(player_score, key=lambda x: (-x[1], x[0]))
-            return (player_score[0][0], 1)
+        if self.fairTurn and self.playerTurn == len(self.players) - 1:
+            # argmax keeps the lowest index among the best scores
+            return (int(np.argmax(self.arrayBoard.scores())), 1)
         return (0, 0)
 
     def _getValue(self):
@@ -603,14 +960,14 @@ class GameState(object):
 
     def _getScore(self):
         # sum all player's score
-        return tuple(p.score for p in self.board[Position.PLAYER_POS])
+        return tuple(int(score) for score in self.arrayBoard.scores())
 
     @staticmethod
-    def build_all_actions():
+    def build_all_actions(player_num=MAX_PLAYERS):
         all_actions = []
         cards = Cards()
         cards = sum(map(list, cards.values()), [])
-        for playerTurn in range(MAX_PLAYERS):
+        for playerTurn in range(player_num):
             all_actions.append(DoNothing(playerTurn))
             # PickStones
             # Pick 1 stone from each color
@@ -630,12 +987,13 @@ class GameState(object):
         '''new_state, value, done
         winner: 0-4 player id
         done: 1 for ending game 0 for otherwise'''
-        new_board = copy.deepcopy(self.board)
+        new_board = self.board.copy()
         self.allActions[action].apply(new_board)
         new_player_turn = (self.playerTurn + 1) % len(self.players)
         new_board['turn'] = new_player_turn
         try:
-            new_state = GameState(new_board, new_player_turn)
+            new_state = GameState(new_board, new_player_turn, self.actionSpace)
+            new_state.isEndGame
         except DeadlockGameError as e:
             print("Seed is %d" % self.seed)
             import pickle
@@ -648,7 +1006,6 @@ class GameState(object):
     def render(self, logger):
         logger.info('-'*20)
 
-GameState.allActions = GameState.build_all_actions()
 
 if __name__ == '__main__':
     seed = random.randrange(sys.maxsize)
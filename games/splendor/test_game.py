@@ -132,6 +132,10 @@ class TestAction(unittest.TestCase):
         b[Position.LINE3] = []
         gs = GameState(b, 0)
         self.assertEqual(gs.allActions[gs.allowedActions[0]].typ, ActionType.DO_NOTHING)
+        for p in range(1, 4):
+            self.assertFalse(gs.deadlock)
+            gs = GameState(b, p)
+        self.assertTrue(gs.deadlock)
 
     def test_not_your_turn(self):
         g, b = self.g, self.b
@@ -141,6 +145,93 @@ class TestAction(unittest.TestCase):
         self.assertFalse(ps.is_playable(b))
 
 
+class TestUndo(unittest.TestCase):
+    def setUp(self):
+        self.g = Game(player_num=4)
+        self.b = self.g.board
+        self.c = self.g.board[Position.LINE1][0]
+
+    def test_undo(self):
+        g, b, c = self.g, self.b, self.c
+        before = repr(b)
+        for action in (PickStones(g.playerTurn, Stones({Color.WHITE: 1, Color.BLUE: 1})),
+                       FoldCard(g.playerTurn, c),
+                       DoNothing(g.playerTurn)):
+            record = b.apply(action)
+            self.assertNotEqual(b['turn'], g.playerTurn)
+            gs = GameState(b, b['turn'])
+            b.undo(record)
+            self.assertEqual(repr(b), before)
+            # the state keeps answering for the board it was built on
+            nb = b.copy()
+            nb.apply(action)
+            ref = GameState(nb, nb['turn'])
+            for attr in ('id', 'allowedActions', 'score', 'isEndGame', 'deadlock'):
+                self.assertEqual(getattr(gs, attr), getattr(ref, attr))
+            self.assertEqual(gs.binary.tolist(), ref.binary.tolist())
+
+    def test_undo_pick_card(self):
+        g, b, c = self.g, self.b, self.c
+        p = g.current_player
+        noble = b[Position.HALL][0]
+        noble.need = Stones({Color.WHITE: 1})
+        c.color = Color.WHITE
+        c.need = Stones({Color.WHITE: 1})
+        p[PlayerElement.STONE] = Stones({Color.WHITE: 1})
+        before = repr(b)
+        record = b.apply(PickCard(g.playerTurn, c))
+        self.assertEqual(p[PlayerElement.NOBLE], [noble])
+        b.undo(record)
+        self.assertEqual(repr(b), before)
+        self.assertEqual(p[PlayerElement.NOBLE], [])
+
+    def test_copy(self):
+        g, b, c = self.g, self.b, self.c
+        before = repr(b)
+        nb = b.copy()
+        FoldCard(g.playerTurn, c).apply(nb)
+        self.assertEqual(repr(b), before)
+        self.assertNotEqual(repr(nb), before)
+        self.assertIs(nb[Position.LINE1][0], b[Position.LINE1][1])
+
+class TestArrayBoard(unittest.TestCase):
+    def setUp(self):
+        self.g = Game(player_num=4)
+        self.b = self.g.board
+        self.c = self.g.board[Position.LINE1][0]
+
+    def test_convert(self):
+        g, b, c = self.g, self.b, self.c
+        FoldCard(g.playerTurn, c).apply(b)
+        ab = ArrayBoard.fromBoard(b)
+        self.assertEqual(ab.cardLocation[c.id], PLAYER_FOLD + g.playerTurn)
+        self.assertEqual(ab.stones.tolist(), stonesToArray(b[Position.STONE]).tolist())
+        for pos in (Position.DECK1, Position.LINE2, Position.LINE3):
+            self.assertEqual([ab.cardLocation[card.id] for card in b[pos]], [pos.value] * len(b[pos]))
+        self.assertEqual([ab.nobleLocation[n.id] for n in b[Position.HALL]], [Position.HALL.value] * len(b[Position.HALL]))
+        # the top of a deck is its first card
+        depth = ab.deckDepth()
+        self.assertEqual([depth[card.id] for card in b[Position.DECK2]], list(range(len(b[Position.DECK2]) - 1, -1, -1)))
+
+class TestActionSpace(unittest.TestCase):
+    def test_size(self):
+        self.assertEqual(Game(player_num=2).action_size, 422)
+        self.assertEqual(Game(player_num=4).action_size, 844)
+        self.assertEqual(Game(player_num=2, relative=True).action_size, 211)
+
+    def test_relative(self):
+        g, rg = Game(player_num=3), Game(player_num=3, relative=True)
+        space = rg.actionSpace
+        for _ in range(10):
+            gs, rgs = g.gameState, rg.gameState
+            self.assertEqual(space.toLegacy(np.array(rgs.allowedActions), rgs.playerTurn).tolist(), gs.allowedActions)
+            pi = np.arange(space.size)
+            self.assertEqual(space.fromLegacyPolicy(space.toLegacyPolicy(pi, rgs.playerTurn), rgs.playerTurn).tolist(), pi.tolist())
+            action = gs.allowedActions[-1]
+            g.step(action)
+            rg.step(space.fromLegacy(action, rgs.playerTurn))
+            self.assertEqual(repr(g.gameState.board), repr(rg.gameState.board))
+
 class TestGameState(unittest.TestCase):
     def setUp(self):
         self.g = Game(player_num=4, seed=0)
@@ -151,6 +242,54 @@ class TestGameState(unittest.TestCase):
         ac = gs.allActions
         self.assertEqual(len(ac), 844)
 
+    def test_allowed_actions(self):
+        g, gs = self.g, self.gs
+        for _ in range(30):
+            self.assertEqual(gs._allowedActions(), gs._allowedActionsLoop())
+            gs, _, done, _ = g.step(gs.allowedActions[-1])
+            if done:
+                break
+
+    def test_do_nothing_count(self):
+        g, gs = self.g, self.gs
+        for _ in range(30):
+            loop = gs._allowedActionsLoop()
+            stuck = gs.allActions[loop[0]].typ == ActionType.DO_NOTHING
+            self.assertEqual(gs.board[Position.DO_NOTHING] > 0, stuck)
+            self.assertEqual(gs.arrayBoard.doNothing, gs.board[Position.DO_NOTHING])
+            gs, _, done, _ = g.step(gs.allowedActions[-1])
+            if done:
+                break
+
+    def test_id(self):
+        g, gs = self.g, self.gs
+        encodings = GameState.idEncodings = {}
+        try:
+            ids = set()
+            for _ in range(20):
+                for action in gs.allowedActions:
+                    ids.add(gs.takeAction(action)[0].id)
+                gs, _, _, _ = g.step(gs.allowedActions[0])
+        finally:
+            GameState.idEncodings = None
+        self.assertEqual(len(ids), len(encodings))
+        b = gs.board.copy()
+        b[Position.LINE1].reverse()
+        self.assertEqual(GameState(b, gs.playerTurn).id, gs.id)
+
+    def test_encode_states(self):
+        g, gs = self.g, self.gs
+        states = [gs]
+        for _ in range(5):
+            gs, _, _, _ = g.step(gs.allowedActions[-1])
+            states.append(gs)
+        batch = encodeStates(states)
+        self.assertEqual(batch.shape, (len(states), 4 * PLAYER_FEATURES))
+        for row, state in zip(batch, states):
+            expected = [state.players[state.playerTurn].binary(state.board)]
+            expected += [p.binary(state.board) for idx, p in enumerate(state.players) if idx != state.playerTurn]
+            self.assertEqual(row.tolist(), np.concatenate(expected).tolist())
+
     def test_end_game(self):
         b = self.g.board
         p = self.g.current_player
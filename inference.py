@@ -0,0 +1,170 @@
+'''Batching inference server shared by several self-play processes
+
+One process holds the Residual_CNN weights and answers the predictions of
+every client, so N workers need one copy of TensorFlow instead of N and their
+single state requests get batched together:
+
+    server = InferenceServer(modelArgs, weights, clients=4)
+    workers = [Process(target=selfplay, args=(server.client(i),)) for i in range(4)]
+    ...
+    server.set_weights(current_NN.model.get_weights())
+    ...
+    server.close()
+
+A client is a drop-in replacement for the model of an Agent, it has the same
+predict, convertToModelInput and version. Each client owns a slice of the
+shared RawArrays for its inputs and outputs, only small messages go through
+the queues. Like the queues, the server and its clients reach other processes
+as Process arguments.
+The server waits for a first request, then keeps gathering requests until it
+has maxBatch states or maxWait seconds have passed, and runs them as one batch.
+Scripts creating a server with the spawn start method need the usual
+`if __name__ == '__main__':` guard.
+'''
+import multiprocessing as mp
+import queue
+import time
+
+import numpy as np
+
+import config
+
+
+class InferenceClient():
+    '''Model proxy for one worker, the buffers are attached on first use'''
+
+    def __init__(self, clientId, input_dim, output_dim, capacity, arrays, requests, responses, version):
+        self.clientId = clientId
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.capacity = capacity
+        self.arrays = arrays
+        self.requests = requests
+        self.responses = responses
+        self._version = version
+        self.buffers = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['buffers'] = None
+        return state
+
+    @property
+    def version(self):
+        return self._version.value
+
+    def _attach(self):
+        self.buffers = _views(self.arrays, self.capacity, self.input_dim, self.output_dim, self.clientId)
+
+    def convertToModelInput(self, state):
+        return np.reshape(state.binary, self.input_dim)
+
+    def predict(self, x):
+        if self.buffers is None:
+            self._attach()
+        bx, bvalue, bpolicy = self.buffers
+
+        values = np.empty((len(x), 1), dtype=np.float32)
+        logits = np.empty((len(x), self.output_dim), dtype=np.float32)
+        for start in range(0, len(x), self.capacity):
+            n = min(self.capacity, len(x) - start)
+            bx[:n] = x[start:start + n]
+            self.requests.put(('predict', self.clientId, n))
+            self.responses.get()
+            values[start:start + n, 0] = bvalue[:n]
+            logits[start:start + n] = bpolicy[:n]
+        return [values, logits]
+
+
+class InferenceServer():
+    '''Owns the server process and the shared buffers of `clients` clients'''
+
+    def __init__(self, modelArgs, weights=None, clients=1, maxBatch=config.INFERENCE_MAX_BATCH
+            , maxWait=config.INFERENCE_MAX_WAIT, startMethod='spawn'):
+        reg_const, learning_rate, input_dim, output_dim, hidden_layers = modelArgs
+        ctx = mp.get_context(startMethod)
+        self.input_dim = tuple(input_dim)
+        self.output_dim = output_dim
+        # a client never sends more than the server batches at once
+        self.capacity = maxBatch
+
+        sizes = [int(np.prod(self.input_dim)), 1, output_dim]
+        self.arrays = [ctx.RawArray('f', clients * maxBatch * size) for size in sizes] # float32
+
+        self.requests = ctx.Queue()
+        self.acks = ctx.Queue()
+        self.responses = [ctx.Queue() for _ in range(clients)]
+        self.version = ctx.Value('i', 0)
+
+        self.process = ctx.Process(target=_serve, args=(modelArgs, weights, self.arrays, self.capacity
+            , self.requests, self.acks, self.responses, self.version, maxBatch, maxWait), daemon=True)
+        self.process.start()
+        self.acks.get() # model built
+
+    def client(self, clientId):
+        return InferenceClient(clientId, self.input_dim, self.output_dim, self.capacity, self.arrays
+            , self.requests, self.responses[clientId], self.version)
+
+    def set_weights(self, weights):
+        '''Load new weights in the server, clients see the new version once it returns'''
+        self.requests.put(('weights', weights))
+        self.acks.get()
+
+    def close(self):
+        self.requests.put(('stop',))
+        self.process.join()
+
+
+def _views(arrays, capacity, input_dim, output_dim, clientId):
+    '''Input, value and policy arrays of one client in the shared buffers'''
+    start, stop = clientId * capacity, (clientId + 1) * capacity
+    x = np.frombuffer(arrays[0], dtype=np.float32).reshape((-1,) + tuple(input_dim))[start:stop]
+    value = np.frombuffer(arrays[1], dtype=np.float32)[start:stop]
+    policy = np.frombuffer(arrays[2], dtype=np.float32).reshape(-1, output_dim)[start:stop]
+    return x, value, policy
+
+
+def _serve(modelArgs, weights, arrays, capacity, requests, acks, responses, version, maxBatch, maxWait):
+    from model import Residual_CNN
+
+    model = Residual_CNN(*modelArgs)
+    if weights is not None:
+        model.set_weights(weights)
+    views = [_views(arrays, capacity, model.input_dim, model.output_dim, i) for i in range(len(responses))]
+    acks.put(True)
+
+    control = []
+    while True:
+        msg = control.pop(0) if control else requests.get()
+        if msg[0] == 'stop':
+            break
+        if msg[0] == 'weights':
+            model.set_weights(msg[1])
+            version.value += 1
+            acks.put(True)
+            continue
+
+        batch = [msg]
+        size = msg[2]
+        deadline = time.time() + maxWait
+        while size < maxBatch:
+            try:
+                msg = requests.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                break
+            if msg[0] != 'predict':
+                # weights and stop wait for the batch in flight
+                control.append(msg)
+                break
+            batch.append(msg)
+            size += msg[2]
+
+        x = np.concatenate([views[clientId][0][:n] for _, clientId, n in batch])
+        preds = model.predict(x)
+        start = 0
+        for _, clientId, n in batch:
+            _, value, policy = views[clientId]
+            value[:n] = preds[0][start:start + n, 0]
+            policy[:n] = preds[1][start:start + n]
+            start += n
+            responses[clientId].put(n)
@@ -55,12 +55,12 @@ if initialise.INITIAL_MODEL_VERSION != None:
     best_player_version  = initialise.INITIAL_MODEL_VERSION
     print('LOADING MODEL VERSION ' + str(initialise.INITIAL_MODEL_VERSION) + '...')
     m_tmp = best_NN.read(env.name, initialise.INITIAL_RUN_NUMBER, best_player_version)
-    current_NN.model.set_weights(m_tmp.get_weights())
-    best_NN.model.set_weights(m_tmp.get_weights())
+    current_NN.set_weights(m_tmp.get_weights())
+    best_NN.set_weights(m_tmp.get_weights())
 #otherwise just ensure the weights on the two players are the same
 else:
     best_player_version = 0
-    best_NN.model.set_weights(current_NN.model.get_weights())
+    best_NN.set_weights(current_NN.model.get_weights())
 
 #copy the config file to the run folder
 copyfile('./config.py', run_folder + 'config.py')
@@ -109,9 +109,11 @@ while 1:
         
         memory_samp = random.sample(memory.ltmemory, min(1000, len(memory.ltmemory)))
         
-        for s in memory_samp:
-            current_value, current_probs, _ = current_player.get_preds(s['state'])
-            best_value, best_probs, _ = best_player.get_preds(s['state'])
+        samp_states = [s['state'] for s in memory_samp]
+        current_preds = current_player.get_preds_batch(samp_states)
+        best_preds = best_player.get_preds_batch(samp_states)
+
+        for s, (current_value, current_probs, _), (best_value, best_probs, _) in zip(memory_samp, current_preds, best_preds):
 
             lg.logger_memory.info('MCTS VALUE FOR %s: %f', s['playerTurn'], s['value'])
             lg.logger_memory.info('CUR PRED VALUE FOR %s: %f', s['playerTurn'], current_value)
@@ -137,7 +139,7 @@ while 1:
 
         if scores['current_player'] > scores['best_player'] * config.SCORING_THRESHOLD:
             best_player_version = best_player_version + 1
-            best_NN.model.set_weights(current_NN.model.get_weights())
+            best_NN.set_weights(current_NN.model.get_weights())
             best_NN.write(env.name, best_player_version)
 
     else:
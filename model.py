@@ -25,12 +25,36 @@ class Gen_Model():
 		self.learning_rate = learning_rate
 		self.input_dim = input_dim
 		self.output_dim = output_dim
+		self.version = 0 # bumped whenever the weights change, invalidates cached evaluations
+		self.fastPredict = None
+		self.fastVersion = None
+		self.inputBuffer = None
 
 	def predict(self, x):
-		return self.model.predict(x)
+		return self.predict_fast(x)
+
+	def predict_fast(self, x):
+		'''predict through a cached backend function, skipping the per call setup of keras predict.
+
+		The function is rebuilt when the version changes, the input buffer when a bigger batch comes.
+		'''
+		if self.fastVersion != self.version:
+			self.fastPredict = K.function(self.model.inputs, self.model.outputs)
+			self.fastVersion = self.version
+		n = len(x)
+		if self.inputBuffer is None or len(self.inputBuffer) < n:
+			self.inputBuffer = np.empty((n,) + tuple(self.input_dim), dtype=np.float32)
+		self.inputBuffer[:n] = x
+		return self.fastPredict(self.inputBuffer[:n])
 
 	def fit(self, states, targets, epochs, verbose, validation_split, batch_size):
-		return self.model.fit(states, targets, epochs=epochs, verbose=verbose, validation_split = validation_split, batch_size = batch_size)
+		fit = self.model.fit(states, targets, epochs=epochs, verbose=verbose, validation_split = validation_split, batch_size = batch_size)
+		self.version += 1
+		return fit
+
+	def set_weights(self, weights):
+		self.model.set_weights(weights)
+		self.version += 1
 
 	def write(self, game, version):
 		self.model.save(run_folder + 'models/version' + "{0:0>4}".format(version) + '.h5')
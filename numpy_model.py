@@ -0,0 +1,160 @@
+'''Inference-only Residual_CNN running on NumPy
+
+Self-play only needs forward passes, this module does them without importing
+TensorFlow:
+
+    export(current_NN, 'version0003.npz')     # in the process owning the Keras model
+    model = NumpyModel.load('version0003.npz') # in any self-play process
+
+export folds every BatchNormalization into the Conv2D before it, so each
+convolution becomes a single kernel and bias:
+
+    scale = gamma / sqrt(moving_variance + epsilon)
+    kernel' = kernel * scale, bias' = beta - moving_mean * scale
+
+NumpyModel has the predict, convertToModelInput and version of a Gen_Model,
+so it can be handed to an Agent as is.
+
+export can also write reduced precision weights, 'float16' or 'int8' with one
+scale per output channel. NumPy has no fast float16 or int8 matrix products,
+so NumpyModel dequantizes them once on load and computes in float32: the
+files are 2x or 4x smaller, the outputs carry the rounding of the weights.
+bench_quantize.py measures how far they drift from the float32 model.
+'''
+import numpy as np
+
+LEAKY_ALPHA = 0.3 # keras LeakyReLU default
+PRECISIONS = ['float32', 'float16', 'int8']
+META = ('tower_size', 'input_dim', 'version', 'precision')
+
+
+def _foldConv(conv, bn):
+    '''Return (kernel as (out, in, kh, kw), bias) of conv followed by bn'''
+    kernel = conv.get_weights()[0]
+    gamma, beta, mean, variance = bn.get_weights()
+    scale = gamma / np.sqrt(variance + bn.epsilon)
+    kernel = np.transpose(kernel, (3, 2, 0, 1)) * scale[:, None, None, None]
+    return kernel.astype(np.float32), (beta - mean * scale).astype(np.float32)
+
+
+def quantize(weights, precision):
+    '''Return weights with the kernels stored in precision, biases stay float32.
+
+    int8 kernels get a float32 `<name>_scale` with one scale per output
+    channel, the first axis of conv kernels and the last of dense ones.
+    '''
+    if precision not in PRECISIONS:
+        raise ValueError('unknown precision %s' % precision)
+    quantized = {}
+    for name, array in weights.items():
+        if name in META or name.endswith('_bias') or precision == 'float32':
+            quantized[name] = array
+        elif precision == 'float16':
+            quantized[name] = array.astype(np.float16)
+        else:
+            axis = 0 if array.ndim == 4 else 1
+            reduced = tuple(i for i in range(array.ndim) if i != axis)
+            scale = np.max(np.abs(array), axis=reduced, keepdims=True) / 127
+            scale[scale == 0] = 1
+            quantized[name] = np.round(array / scale).astype(np.int8)
+            quantized[name + '_scale'] = scale.astype(np.float32)
+    return quantized
+
+
+def dequantize(weights):
+    '''Inverse of quantize, every array back in float32'''
+    arrays = {}
+    for name, array in weights.items():
+        if name in META or name.endswith('_scale'):
+            continue
+        array = np.asarray(array, dtype=np.float32)
+        if name + '_scale' in weights:
+            array = array * weights[name + '_scale']
+        arrays[name] = array
+    return arrays
+
+
+def export(nn, path, precision='float32'):
+    '''Write the weights of the Residual_CNN nn, batch norms folded, to an npz file'''
+    layers = nn.model.layers
+    convs = [l for l in layers if type(l).__name__ == 'Conv2D']
+    bns = [l for l in layers if type(l).__name__ == 'BatchNormalization']
+    denses = {l.name: l for l in layers if type(l).__name__ == 'Dense'}
+
+    arrays = {}
+    tower = []
+    for bn in bns:
+        conv = [c for c in convs if c.output is bn.input][0]
+        kernel, bias = _foldConv(conv, bn)
+        if conv.kernel_size == (1, 1) and kernel.shape[0] == 1:
+            name = 'value'
+        elif conv.kernel_size == (1, 1) and kernel.shape[0] == 2:
+            name = 'policy'
+        else:
+            name = 'conv%d' % len(tower)
+            tower.append(name)
+        arrays[name + '_kernel'] = kernel
+        arrays[name + '_bias'] = bias
+
+    arrays['value_dense'] = denses.pop('value_head').get_weights()[0]
+    arrays['policy_dense'] = denses.pop('policy_head').get_weights()[0]
+    arrays['value_hidden'] = list(denses.values())[0].get_weights()[0]
+    arrays['tower_size'] = np.array(len(tower))
+    arrays['input_dim'] = np.array(nn.input_dim)
+    arrays['version'] = np.array(nn.version)
+    arrays['precision'] = np.array(precision)
+    np.savez(path, **quantize(arrays, precision))
+
+
+def _leaky(x):
+    return np.where(x > 0, x, LEAKY_ALPHA * x)
+
+
+def _conv(x, kernel, bias):
+    '''channels_first convolution with keras 'same' padding'''
+    kh, kw = kernel.shape[2:]
+    if (kh, kw) == (1, 1):
+        out = np.tensordot(kernel[:, :, 0, 0], x, axes=([1], [1])) # (out, N, H, W)
+        return np.transpose(out, (1, 0, 2, 3)) + bias[None, :, None, None]
+    # an even kernel puts the extra padding after, like tensorflow
+    padded = np.pad(x, ((0, 0), (0, 0), ((kh - 1) // 2, kh // 2), ((kw - 1) // 2, kw // 2)), 'constant')
+    strides = padded.strides
+    windows = np.lib.stride_tricks.as_strided(padded, x.shape + (kh, kw), strides + strides[2:]) # (N, C, H, W, kh, kw)
+    out = np.tensordot(windows, kernel, axes=([1, 4, 5], [1, 2, 3])) # (N, H, W, out)
+    return np.transpose(out, (0, 3, 1, 2)) + bias[None, :, None, None]
+
+
+class NumpyModel():
+
+    def __init__(self, weights):
+        self.weights = dequantize(weights)
+        self.precision = str(weights.get('precision', 'float32'))
+        self.towerSize = int(weights['tower_size'])
+        self.input_dim = tuple(int(d) for d in weights['input_dim'])
+        self.output_dim = self.weights['policy_dense'].shape[1]
+        self.version = int(weights['version'])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as weights:
+            return cls(dict(weights))
+
+    def convertToModelInput(self, state):
+        return np.reshape(state.binary, self.input_dim)
+
+    def predict(self, x):
+        w = self.weights
+        x = np.asarray(x, dtype=np.float32)
+
+        x = _leaky(_conv(x, w['conv0_kernel'], w['conv0_bias']))
+        for i in range(1, self.towerSize, 2):
+            y = _leaky(_conv(x, w['conv%d_kernel' % i], w['conv%d_bias' % i]))
+            y = _conv(y, w['conv%d_kernel' % (i + 1)], w['conv%d_bias' % (i + 1)])
+            x = _leaky(x + y)
+
+        n = len(x)
+        v = _leaky(_conv(x, w['value_kernel'], w['value_bias'])).reshape(n, -1)
+        v = np.tanh(_leaky(v @ w['value_hidden']) @ w['value_dense'])
+        p = _leaky(_conv(x, w['policy_kernel'], w['policy_bias'])).reshape(n, -1)
+        p = p @ w['policy_dense']
+        return [v, p]